@@ -0,0 +1,399 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+import PIL
+from PIL import Image, ImageDraw
+
+# Reproducible benchmarks on generated photo archives. The core benchmarks run anywhere; the
+# GUI ones need a display, e.g. `xvfb-run python benchmark.py` on a server. Results can be
+# written with --output and compared against an earlier run with --compare.
+
+
+def build_exif(date_taken=None, preview=None):
+    # Little-endian EXIF block with DateTimeOriginal and an optional IFD1 JPEG preview;
+    # Pillow can read IFD1 but not write it
+    date_bytes = date_taken.encode('ascii') + b'\x00' if date_taken else b''
+    ifd0_size = 2 + 12 * (1 if date_taken else 0) + 4
+    exif_ifd_offset = 8 + ifd0_size
+    date_offset = exif_ifd_offset + (18 if date_taken else 0)
+    ifd1_offset = date_offset + len(date_bytes)
+    preview_offset = ifd1_offset + 2 + 12 * 3 + 4
+
+    data = b'II*\x00' + struct.pack('<I', 8)
+    data += struct.pack('<H', 1 if date_taken else 0)
+    if date_taken:
+        data += struct.pack('<HHII', 0x8769, 4, 1, exif_ifd_offset)
+    data += struct.pack('<I', ifd1_offset if preview else 0)
+    if date_taken:
+        data += struct.pack('<H', 1) + struct.pack('<HHII', 0x9003, 2, len(date_bytes), date_offset)
+        data += struct.pack('<I', 0) + date_bytes
+    if preview:
+        data += struct.pack('<H', 3)
+        data += struct.pack('<HHIHH', 0x0103, 3, 1, 6, 0)  # Compression: JPEG
+        data += struct.pack('<HHII', 0x0201, 4, 1, preview_offset)
+        data += struct.pack('<HHII', 0x0202, 4, 1, len(preview))
+        data += struct.pack('<I', 0) + preview
+    return b'Exif\x00\x00' + data
+
+
+def synthetic_image(rng, size):
+    # Some shapes on a flat background so JPEG has detail to encode
+    img = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + size[0] // 5, y + size[1] // 5),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return img
+
+
+EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp'}
+
+
+def generate_archive(folder, count, size=(1600, 1200), formats=('jpeg',), exif_ratio=1.0, layout='flat',
+                     preview_size=(320, 240), seed=0):
+    # Writes count photos cycling through formats; exif_ratio of them get a DateTimeOriginal
+    # (JPEGs also an EXIF preview). 'nested' lays them out as YYYY/MM folders.
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        image_format = formats[i % len(formats)]
+        img = synthetic_image(rng, size)
+        taken = datetime(rng.randint(2000, 2024), rng.randint(1, 12), rng.randint(1, 28), 12)
+        target = folder if layout == 'flat' else os.path.join(folder, f"{taken:%Y}", f"{taken:%m}")
+        os.makedirs(target, exist_ok=True)
+        preview = None
+        if image_format == 'jpeg' and preview_size:
+            buffer = io.BytesIO()
+            img.resize(preview_size).save(buffer, 'JPEG', quality=75)
+            preview = buffer.getvalue()
+        save_args = {'jpeg': {'quality': 85}, 'png': {}, 'webp': {'quality': 80}}[image_format]
+        if rng.random() < exif_ratio:
+            save_args['exif'] = build_exif(f"{taken:%Y:%m:%d %H:%M:%S}", preview)
+        elif preview:
+            save_args['exif'] = build_exif(None, preview)
+        path = os.path.join(target, f"IMG_{i:06d}{EXTENSIONS[image_format]}")
+        img.save(path, **save_args)
+        paths.append(path)
+    return paths
+
+
+class Results:
+    # Collects timings and writes them as JSON so runs can be compared
+    def __init__(self, meta):
+        self.meta = meta
+        self.results = {}
+
+    def measure(self, name, func, repeat=3, items=1, setup=None):
+        # Times func repeat times (setup runs untimed before each), reports per item
+        runs = []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+        self.add(name, runs, items)
+
+    def add(self, name, runs, items=1):
+        best = min(runs)
+        self.results[name] = {'best_s': best, 'mean_s': sum(runs) / len(runs), 'runs_s': runs, 'items': items,
+                              'best_per_item_ms': best / items * 1000}
+        per_item = f"  {best / items * 1000:9.3f} ms/item" if items > 1 else ""
+        print(f"{name:<40} {best:9.4f} s{per_item}")
+
+    def skip(self, name, reason):
+        self.results[name] = {'skipped': reason}
+        print(f"{name:<40} skipped: {reason}")
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'meta': self.meta, 'results': self.results}, f, indent=2)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    print(f"\nCompared with {baseline_path} (best time, >1.00x is slower now):")
+    for name, result in results.results.items():
+        before = baseline.get(name, {})
+        if 'best_s' in result and before.get('best_s'):
+            print(f"{name:<40} {before['best_s']:9.4f} s -> {result['best_s']:9.4f} s  "
+                  f"{result['best_s'] / before['best_s']:.2f}x")
+
+
+def run_meta(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'pillow': PIL.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'args': vars(args)}
+
+
+def reset_cache_dir(cache_dir):
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir)
+
+
+def bench_scan(results, folder, args, cache_dir):
+    from photo_core import IMAGE_EXTENSIONS, MetadataIndex, scan_photos
+    recursive = args.layout == 'nested'
+    results.measure('scan.cold.serial', lambda: scan_photos(folder, IMAGE_EXTENSIONS, recursive=recursive),
+                    args.repeat)
+    for kind in ('thread', 'process'):
+        results.measure(f'scan.cold.{kind}_x{args.workers}',
+                        lambda: scan_photos(folder, IMAGE_EXTENSIONS, workers=args.workers, executor_kind=kind,
+                                            recursive=recursive), args.repeat)
+    index = MetadataIndex(os.path.join(cache_dir, 'bench_index.sqlite'))
+    scan_photos(folder, IMAGE_EXTENSIONS, index, recursive=recursive)
+    results.measure('scan.warm_index', lambda: scan_photos(folder, IMAGE_EXTENSIONS, index, recursive=recursive),
+                    args.repeat)
+    index.close()
+
+
+def bench_metadata(results, paths, args):
+    from photo_core import read_header_metadata, read_photo_metadata_pil, read_photo_metadata
+    for name, reader in (('pil', read_photo_metadata_pil), ('header', read_header_metadata),
+                         ('read_photo_metadata', read_photo_metadata)):
+        results.measure(f'metadata.{name}', lambda: [reader(path) for path in paths], args.repeat, len(paths))
+
+
+def bench_thumbnails(results, paths, args):
+    from photo_core import make_thumbnail, THUMBNAIL_STRATEGIES
+    jpegs = [path for path in paths if path.endswith('.jpg')]
+    results.measure('thumbnail.auto', lambda: [make_thumbnail(path) for path in paths], args.repeat, len(paths))
+    for strategy in THUMBNAIL_STRATEGIES:
+        if jpegs:
+            results.measure(f'thumbnail.jpeg.{strategy}',
+                            lambda: [make_thumbnail(path, strategy=strategy) for path in jpegs], args.repeat,
+                            len(jpegs))
+
+
+def bench_filter(results, args):
+    # Date index on a synthetic photo_data much larger than the generated archive
+    from photo_core import DateIndex, SortedPhotoList
+    rng = random.Random(args.seed)
+    items = [(f"IMG_{i:07d}.jpg", datetime(rng.randint(2000, 2024), rng.randint(1, 12), rng.randint(1, 28)))
+             for i in range(args.filter_size)]
+    photo_data = SortedPhotoList(items)
+    results.measure('filter.sorted_insert_batch', lambda: SortedPhotoList(items[:-1000]).add_batch(items[-1000:]),
+                    args.repeat)
+    results.measure('filter.index_build', lambda: DateIndex(photo_data), args.repeat)
+    index = DateIndex(photo_data)
+    results.measure('filter.range_query', lambda: [index.range(date(year, 1, 1), date(year, 1, 31))
+                                                   for year in range(2000, 2025)], args.repeat, 25)
+    results.measure('filter.full_scan_baseline',
+                    lambda: [[item for item in photo_data if item[1].date() == date(year, 1, 15)]
+                             for year in range(2000, 2003)], args.repeat, 3)
+
+
+def bench_pyramid(results, folder, args):
+    from photo_core import ImagePyramid
+    path = os.path.join(folder, 'large.jpg')
+    synthetic_image(random.Random(args.seed), tuple(args.large_size)).save(path, quality=90)
+    view = (1200, 800)
+
+    def open_fitted():
+        pyramid = ImagePyramid(path)
+        scale = min(view[0] / pyramid.size[0], view[1] / pyramid.size[1])
+        pyramid.render(scale, (0, 0) + pyramid.size, (int(pyramid.size[0] * scale), int(pyramid.size[1] * scale)))
+
+    results.measure('pyramid.open_fitted', open_fitted, args.repeat)
+    pyramid = ImagePyramid(path)
+    width, height = pyramid.size
+
+    def zoom_steps():
+        scale = min(view[0] / width, view[1] / height)
+        while scale < 1.0:
+            scale *= 1.1
+            box_width, box_height = min(width, view[0] / scale), min(height, view[1] / scale)
+            left, top = (width - box_width) / 2, (height - box_height) / 2
+            pyramid.render(scale, (left, top, left + box_width, top + box_height),
+                           (int(box_width * scale), int(box_height * scale)))
+
+    results.measure('pyramid.zoom_to_100', zoom_steps, args.repeat)
+
+
+def pump(root, done, timeout=120):
+    # Runs the Tk event loop until done() or the timeout
+    deadline = time.perf_counter() + timeout
+    while not done() and time.perf_counter() < deadline:
+        root.update()
+        time.sleep(0.001)
+
+
+def bench_gui(results, folder, paths, args, work_dir, cache_dir):
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:  # no display, or Python built without Tk
+        for name in ('gui.load_photos', 'gui.get_thumbnail', 'gui.get_filtered_photos', 'gui.page_flip',
+                     'gui.zoom_image', 'gui.rotate_image'):
+            results.skip(name, f"Tk unavailable ({e})")
+        return
+    from photo_viewer import PhotoViewerApp
+    app = PhotoViewerApp(root)
+    root.geometry("1200x900")
+    root.update()
+
+    def load(rescan):
+        if rescan:  # cold: no metadata index
+            if app.metadata_index:
+                app.metadata_index.close()
+                app.metadata_index = None
+            app.thumbnail_store = None
+            reset_cache_dir(cache_dir)
+        app.archive_path = folder
+        # archives (recursive, EXIF dates only) for nested layouts, flat folders otherwise, as the File menu does
+        app.sort_by_date = args.layout == 'nested'
+        app.start_loading_photos()
+        pump(root, lambda: not app.loading_in_progress)
+        assert app.photo_data, f"the GUI loaded no photos from {folder}"
+
+    results.measure('gui.load_photos.cold', lambda: load(True), args.repeat)
+    results.measure('gui.load_photos.warm', lambda: load(False), args.repeat)
+
+    sample = paths[:args.thumbnails]
+
+    def clear_memory():
+        app.thumbnail_cache.clear()
+        app.photo_image_cache.clear()
+
+    def clear_all():
+        clear_memory()
+        app.thumbnail_store = None
+        reset_cache_dir(os.path.join(cache_dir, 'thumbnails'))
+
+    results.measure('gui.get_thumbnail.cold', lambda: [app.get_thumbnail(path) for path in sample], args.repeat,
+                    len(sample), setup=clear_all)
+    results.measure('gui.get_thumbnail.disk', lambda: [app.get_thumbnail(path) for path in sample], args.repeat,
+                    len(sample), setup=clear_memory)
+    results.measure('gui.get_thumbnail.memory', lambda: [app.get_thumbnail(path) for path in sample],
+                    args.repeat, len(sample))
+
+    def invalidate():
+        app.photo_data_version += 1
+
+    app.date_from, app.date_to = date(2010, 1, 1), date(2015, 12, 31)
+    results.measure('gui.get_filtered_photos.uncached', app.get_filtered_photos, args.repeat, setup=invalidate)
+    results.measure('gui.get_filtered_photos.cached', lambda: [app.get_filtered_photos() for _ in range(100)],
+                    args.repeat, 100)
+    app.date_from = app.date_to = None
+
+    for mode in ('pages', 'scroll'):
+        app.view_mode.set(mode)
+        app.change_view_mode()
+        pump(root, lambda: not app.pending_tiles)
+        flips = max(1, min(args.page_flips, len(app.photo_data) // app.photos_per_page - 1))
+
+        def flip():
+            for _ in range(flips):
+                app.next_page()
+                pump(root, lambda: not app.pending_tiles)  # until every thumbnail on the page is shown
+
+        def rewind():
+            app.go_to_start()
+            app.display_photos()
+            pump(root, lambda: not app.pending_tiles)
+
+        results.measure(f'gui.page_flip.{mode}', flip, args.repeat, flips, setup=rewind)
+
+    large = os.path.join(work_dir, 'large.jpg')  # outside the archive so it isn't scanned
+    if not os.path.exists(large):
+        synthetic_image(random.Random(args.seed), tuple(args.large_size)).save(large, quality=90)
+    results.measure('gui.open_full_size_image', lambda: (app.open_full_size_image(None, large), root.update()),
+                    args.repeat, setup=app.viewer_cache.clear)
+    results.measure('gui.zoom_image', lambda: [(app.zoom_image(1.1), root.update()) for _ in range(10)],
+                    args.repeat, 10, setup=lambda: app.open_full_size_image(None, large))
+    results.measure('gui.rotate_image', lambda: [(app.rotate_image(90), root.update()) for _ in range(4)],
+                    args.repeat, 4, setup=lambda: app.open_full_size_image(None, large))
+    root.destroy()
+
+
+BENCHMARKS = ('scan', 'metadata', 'thumbnails', 'filter', 'pyramid', 'gui')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Photo Viewer benchmarks on generated photo archives")
+    parser.add_argument('--count', type=int, default=300, help="number of photos to generate")
+    parser.add_argument('--size', type=int, nargs=2, default=(1600, 1200), metavar=('W', 'H'),
+                        help="resolution of the generated photos")
+    parser.add_argument('--formats', default='jpeg', help="comma separated mix of jpeg, png, webp")
+    parser.add_argument('--exif-ratio', type=float, default=1.0, help="share of photos with an EXIF date")
+    parser.add_argument('--layout', choices=('flat', 'nested'), default='flat', help="nested uses YYYY/MM folders")
+    parser.add_argument('--preview-size', type=int, nargs=2, default=(320, 240), metavar=('W', 'H'),
+                        help="embedded EXIF preview size for JPEGs, 0 0 for none")
+    parser.add_argument('--large-size', type=int, nargs=2, default=(6000, 4000), metavar=('W', 'H'),
+                        help="resolution of the image used for the zoom benchmarks")
+    parser.add_argument('--filter-size', type=int, default=100000, help="photo_data size for the filter benchmark")
+    parser.add_argument('--thumbnails', type=int, default=50, help="photos used by the GUI thumbnail benchmark")
+    parser.add_argument('--page-flips', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bench', default=','.join(BENCHMARKS), help=f"comma separated subset of {BENCHMARKS}")
+    parser.add_argument('--folder', help="existing archive to use instead of generating one")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    args = parser.parse_args()
+    selected = [name.strip() for name in args.bench.split(',') if name.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    work_dir = tempfile.mkdtemp(prefix='photo_viewer_bench_')
+    # keep the benchmark away from the user's real index and thumbnails
+    cache_dir = os.path.join(work_dir, 'cache')
+    os.makedirs(cache_dir)
+    os.environ['PHOTO_VIEWER_CACHE_DIR'] = cache_dir
+    try:
+        folder = args.folder
+        if folder:
+            from photo_core import IMAGE_EXTENSIONS, scan_photos
+            paths = [path for path, _ in scan_photos(folder, IMAGE_EXTENSIONS, recursive=True)]
+        else:
+            folder = os.path.join(work_dir, 'archive')
+            formats = tuple(name.strip() for name in args.formats.split(','))
+            print(f"Generating {args.count} photos ({'/'.join(formats)}, {args.layout}) in {folder}...")
+            paths = generate_archive(folder, args.count, tuple(args.size), formats, args.exif_ratio, args.layout,
+                                     tuple(args.preview_size) if all(args.preview_size) else None, args.seed)
+        results = Results(run_meta(args))
+        if 'scan' in selected:
+            bench_scan(results, folder, args, cache_dir)
+        if 'metadata' in selected:
+            bench_metadata(results, paths, args)
+        if 'thumbnails' in selected:
+            bench_thumbnails(results, paths, args)
+        if 'filter' in selected:
+            bench_filter(results, args)
+        if 'pyramid' in selected:
+            bench_pyramid(results, work_dir, args)
+        if 'gui' in selected:
+            bench_gui(results, folder, paths, args, work_dir, cache_dir)
+        if args.output:
+            results.save(args.output)
+            print(f"\nResults written to {args.output}")
+        if args.compare:
+            compare(results, args.compare)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
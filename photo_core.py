@@ -0,0 +1,1487 @@
+import os
+import sys
+import io
+import struct
+import time
+import hashlib
+import sqlite3
+import argparse
+import functools
+import threading
+import json
+import csv
+import cProfile
+import pstats
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from bisect import bisect_left, bisect_right
+from collections import deque, OrderedDict, defaultdict
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image, ExifTags
+
+try:
+    # optional: native change notifications (inotify, FSEvents, ReadDirectoryChangesW) for FolderWatcher
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+try:
+    # optional: vectorized hash comparison for find_duplicate_groups
+    import numpy as np
+except ImportError:
+    np = None
+
+# GUI-free part of the viewer: scanning, metadata, caches and thumbnails.
+# Also usable from the command line to pre-warm the caches, see main().
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp')
+
+
+class Instrumentation:
+    # Opt-in timers and counters for the hot paths; disabled, timer() and timed() cost two attribute
+    # checks per call and hand out a shared no-op context manager.
+    # profile_next(name) additionally captures the next `name` operation with cProfile.
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.timers = {}  # name -> [count, total, min, max] in seconds
+        self.counters = {}
+        self.profile_target = None
+        self.profile_callback = None
+        self.last_profile_path = None
+        self.last_profile_summary = None
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = min(timer[2], seconds)
+                timer[3] = max(timer[3], seconds)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timer(self, name):
+        if not self.enabled and self.profile_target is None:
+            return NO_TIMER
+        return self.measure(name)
+
+    @contextmanager
+    def measure(self, name):
+        if self.profile_target == name:
+            with self.lock:
+                profiling = self.profile_target == name
+                self.profile_target = None
+            if profiling:
+                with self.profile(name):
+                    yield
+                return
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        # Decorator form of timer()
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled and self.profile_target is None:
+                    return func(*args, **kwargs)
+                with self.measure(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def profile(self, name):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.add_time(name, time.perf_counter() - start)
+            folder = os.path.join(get_cache_dir(), 'profiles')
+            os.makedirs(folder, exist_ok=True)
+            self.last_profile_path = os.path.join(folder, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.prof")
+            profiler.dump_stats(self.last_profile_path)
+            # the top of the profile as text, saved next to the .prof and handed to the callback
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+            self.last_profile_summary = summary.getvalue()
+            with open(os.path.splitext(self.last_profile_path)[0] + '.txt', 'w', encoding='utf-8') as f:
+                f.write(self.last_profile_summary)
+            if self.profile_callback:
+                self.profile_callback(self.last_profile_path, self.last_profile_summary)
+
+    def profile_next(self, name, callback=None):
+        # cProfile only sees the thread running the operation
+        with self.lock:
+            self.profile_target = name
+            self.profile_callback = callback
+
+    def snapshot(self):
+        with self.lock:
+            timers = {name: {'count': count, 'total_ms': total * 1000, 'mean_ms': total / count * 1000,
+                             'min_ms': low * 1000, 'max_ms': high * 1000}
+                      for name, (count, total, low, high) in sorted(self.timers.items())}
+            return {'timers': timers, 'counters': dict(sorted(self.counters.items()))}
+
+    def reset(self):
+        with self.lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def dump_csv(self, path):
+        snapshot = self.snapshot()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'count', 'total_ms', 'mean_ms', 'min_ms', 'max_ms'])
+            for name, timer in snapshot['timers'].items():
+                writer.writerow([name, timer['count'], f"{timer['total_ms']:.3f}", f"{timer['mean_ms']:.3f}",
+                                 f"{timer['min_ms']:.3f}", f"{timer['max_ms']:.3f}"])
+            for name, value in snapshot['counters'].items():
+                writer.writerow([name, value, '', '', '', ''])
+
+
+NO_TIMER = nullcontext()
+instrumentation = Instrumentation()
+
+
+def get_cache_dir():
+    # Per-user cache folder for the metadata index, thumbnails and profiles;
+    # PHOTO_VIEWER_CACHE_DIR overrides it (used by the benchmarks)
+    if os.environ.get('PHOTO_VIEWER_CACHE_DIR'):
+        path = os.environ['PHOTO_VIEWER_CACHE_DIR']
+        os.makedirs(path, exist_ok=True)
+        return path
+    if os.name == 'nt':  # Windows
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':  # macOS
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    path = os.path.join(base, 'PhotoViewer')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def parse_exif_date(value):
+    # EXIF dates look like "2023:07:14 18:02:11", only the day part is used
+    date_str = str(value).strip('\x00 ').split(' ')[0]
+    return datetime.strptime(date_str, '%Y:%m:%d')
+
+
+def parse_tiff_metadata(read_at):
+    # Walks a TIFF/EXIF structure for DateTimeOriginal and the IFD0 image size.
+    # read_at(offset, length) returns bytes relative to the TIFF header.
+    header = read_at(0, 8)
+    if header[:4] == b'II*\x00':
+        endian = '<'
+    elif header[:4] == b'MM\x00*':
+        endian = '>'
+    else:
+        raise ValueError("not a TIFF header")
+
+    def read_ifd(offset):
+        count = struct.unpack(endian + 'H', read_at(offset, 2))[0]
+        data = read_at(offset + 2, count * 12)
+        return {tag: (value_type, value_count, data[i * 12 + 8:i * 12 + 12])
+                for i, (tag, value_type, value_count) in
+                ((i, struct.unpack_from(endian + 'HHI', data, i * 12)) for i in range(len(data) // 12))}
+
+    def number(entry):
+        value_type, _, raw = entry
+        return struct.unpack_from(endian + ('H' if value_type == 3 else 'I'), raw)[0]
+
+    ifd0 = read_ifd(struct.unpack(endian + 'I', header[4:8])[0])
+    width = number(ifd0[0x0100]) if 0x0100 in ifd0 else None
+    height = number(ifd0[0x0101]) if 0x0101 in ifd0 else None
+    entry = None
+    if 0x8769 in ifd0:  # DateTimeOriginal lives in the Exif sub-IFD, some writers put it in IFD0
+        entry = read_ifd(number(ifd0[0x8769])).get(0x9003)
+    if entry is None:
+        entry = ifd0.get(0x9003)
+    date_taken = None
+    if entry is not None:
+        _, value_count, raw = entry
+        value = raw[:value_count] if value_count <= 4 else read_at(struct.unpack(endian + 'I', raw)[0], value_count)
+        try:
+            date_taken = parse_exif_date(value.decode('ascii', 'replace'))
+        except ValueError:
+            pass  # placeholder dates such as "0000:00:00 00:00:00"
+    return date_taken, width, height
+
+
+def read_jpeg_header(f):
+    # Hops from marker to marker up to the first frame header, reading only APP1 and SOFn
+    date_taken = None
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError("corrupt JPEG marker")
+        while marker[1] == 0xFF:  # fill bytes
+            marker = marker[1:] + f.read(1)
+        code = marker[1]
+        if code in (0xD9, 0xDA):  # end of image / start of scan without a frame header
+            return date_taken, None, None
+        if code == 0x01 or 0xD0 <= code <= 0xD8:  # markers without a length
+            continue
+        length = struct.unpack('>H', f.read(2))[0] - 2
+        if code == 0xE1 and date_taken is None:
+            segment = f.read(length)
+            if segment.startswith(b'Exif\x00\x00'):
+                tiff = segment[6:]
+                date_taken = parse_tiff_metadata(lambda offset, size: tiff[offset:offset + size])[0]
+        elif 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):  # SOFn
+            height, width = struct.unpack('>xHH', f.read(5))
+            return date_taken, width, height
+        else:
+            f.seek(length, 1)
+
+
+def read_webp_header(f):
+    # Walks the RIFF chunks for the canvas size and the EXIF chunk
+    date_taken = width = height = None
+    f.seek(12)
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return date_taken, width, height
+        name, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        start = f.tell()
+        if name == b'VP8X':
+            data = f.read(10)
+            width = int.from_bytes(data[4:7], 'little') + 1
+            height = int.from_bytes(data[7:10], 'little') + 1
+        elif name == b'VP8 ' and width is None:
+            data = f.read(10)
+            width, height = (value & 0x3FFF for value in struct.unpack('<HH', data[6:10]))
+            return date_taken, width, height  # simple format, no metadata chunks
+        elif name == b'VP8L' and width is None:
+            bits = int.from_bytes(f.read(5)[1:], 'little')
+            return date_taken, (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif name == b'EXIF':
+            data = f.read(size)
+            if data.startswith(b'Exif\x00\x00'):
+                data = data[6:]
+            date_taken = parse_tiff_metadata(lambda offset, length: data[offset:offset + length])[0]
+            if width is not None:
+                return date_taken, width, height
+        f.seek(start + size + (size & 1))  # chunks are padded to an even size
+
+
+def read_header_metadata(filepath):
+    # Fast path for the scanner: (date_taken, width, height) parsed straight from the JPEG,
+    # TIFF or WebP header without going through PIL. None for other formats.
+    with open(filepath, 'rb') as f:
+        signature = f.read(12)
+        if signature[:2] == b'\xff\xd8':
+            return read_jpeg_header(f)
+        if signature[:4] in (b'II*\x00', b'MM\x00*'):
+            def read_at(offset, size):
+                f.seek(offset)
+                return f.read(size)
+            return parse_tiff_metadata(read_at)
+        if signature[:4] == b'RIFF' and signature[8:12] == b'WEBP':
+            return read_webp_header(f)
+    return None
+
+
+def read_photo_metadata_pil(filepath):
+    # Returns (date_taken, width, height) from a single Image.open of the header
+    try:
+        with Image.open(filepath) as img:
+            width, height = img.size
+            exif = img.getexif()
+            value = exif.get_ifd(0x8769).get(0x9003) or exif.get(0x9003)  # DateTimeOriginal
+            return (parse_exif_date(value) if value else None), width, height
+    except Exception as e:
+        print(f"Error extracting date from {filepath}: {e}")
+        return None, None, None
+
+
+def read_photo_metadata(filepath):
+    # Returns (date_taken, width, height); PIL handles other formats and anything the header parser rejects
+    try:
+        metadata = read_header_metadata(filepath)
+        if metadata is not None and metadata[1]:
+            return metadata
+    except Exception:
+        pass
+    return read_photo_metadata_pil(filepath)
+
+
+def to_signed64(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class MetadataIndex:
+    # Persistent SQLite index of extracted metadata, keyed by path + size + mtime
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'metadata.sqlite')
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, folder TEXT, size INTEGER, "
+                              "mtime_ns INTEGER, date_taken TEXT, width INTEGER, height INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_folder ON files (folder)")
+            # directory mtimes from the last complete scan, used to skip re-listing unchanged folders;
+            # recursive tells whether that scan also walked the subfolders
+            self.conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER, "
+                              "recursive INTEGER)")
+            if 'recursive' not in {row[1] for row in self.conn.execute("PRAGMA table_info(dirs)")}:
+                self.conn.execute("ALTER TABLE dirs ADD COLUMN recursive INTEGER")
+            # perceptual hashes, added to indexes created before duplicate detection
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+            for column in ('ahash', 'dhash'):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER")
+            self.conn.commit()
+
+    @staticmethod
+    def subtree_range(root):
+        # Bounds matching every path below root with a plain index range scan
+        prefix = root.rstrip(os.sep) + os.sep
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def get_folder(self, folder):
+        # {filepath: (size, mtime_ns, date_taken, width, height)} for every indexed file directly in folder
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size, mtime_ns, date_taken, width, height FROM files "
+                                     "WHERE folder = ?", (folder,)).fetchall()
+        return {path: (size, mtime_ns, datetime.fromisoformat(date_taken) if date_taken else None, width, height)
+                for path, size, mtime_ns, date_taken, width, height in rows}
+
+    def get_tree(self, root):
+        # {folder: get_folder(folder)} for root and every folder below it, in one query
+        low, high = self.subtree_range(root)
+        with self.lock:
+            rows = self.conn.execute("SELECT path, folder, size, mtime_ns, date_taken, width, height FROM files "
+                                     "WHERE path >= ? AND path < ?", (low, high)).fetchall()
+        tree = {}
+        for path, folder, size, mtime_ns, date_taken, width, height in rows:
+            tree.setdefault(folder, {})[path] = (size, mtime_ns,
+                                                 datetime.fromisoformat(date_taken) if date_taken else None,
+                                                 width, height)
+        return tree
+
+    def get_dirs(self, root, recursive=True):
+        # {dirpath: (parent, mtime_ns, recursive)} for root and, if recursive, every directory below it
+        with self.lock:
+            rows = self.conn.execute("SELECT path, parent, mtime_ns, recursive FROM dirs WHERE path = ?",
+                                     (root,)).fetchall()
+            if recursive:
+                rows += self.conn.execute("SELECT path, parent, mtime_ns, recursive FROM dirs "
+                                          "WHERE path >= ? AND path < ?", self.subtree_range(root)).fetchall()
+        return {path: (parent, mtime_ns, bool(recursive_scan)) for path, parent, mtime_ns, recursive_scan in rows}
+
+    def store_dirs(self, entries, recursive=False):
+        # entries: iterable of (dirpath, mtime_ns) listed by a scan that did or did not walk subfolders
+        rows = [(path, os.path.dirname(path), mtime_ns, int(recursive)) for path, mtime_ns in entries]
+        if rows:
+            with self.lock:
+                self.conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", rows)
+                self.conn.commit()
+
+    def remove_dirs(self, paths):
+        # Forgets the directories and the files directly inside them
+        paths = [(path,) for path in paths]
+        if paths:
+            with self.lock:
+                self.conn.executemany("DELETE FROM dirs WHERE path = ?", paths)
+                self.conn.executemany("DELETE FROM files WHERE folder = ?", paths)
+                self.conn.commit()
+
+    def store(self, entries):
+        # entries: iterable of (filepath, size, mtime_ns, date_taken, width, height)
+        rows = [(path, os.path.dirname(path), size, mtime_ns, date_taken.isoformat() if date_taken else None,
+                 width, height) for path, size, mtime_ns, date_taken, width, height in entries]
+        if rows:
+            with self.lock:
+                # replacing the row also clears hashes computed from an older version of the file
+                self.conn.executemany("INSERT OR REPLACE INTO files (path, folder, size, mtime_ns, date_taken, width, "
+                                      "height) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self.conn.commit()
+
+    def get_hashes(self, root):
+        # {filepath: (ahash, dhash)} for every hashed file below root
+        low, high = self.subtree_range(root)
+        with self.lock:
+            rows = self.conn.execute("SELECT path, ahash, dhash FROM files WHERE path >= ? AND path < ? "
+                                     "AND ahash IS NOT NULL", (low, high)).fetchall()
+        # SQLite integers are signed 64 bit
+        return {path: (ahash & 0xFFFFFFFFFFFFFFFF, dhash & 0xFFFFFFFFFFFFFFFF) for path, ahash, dhash in rows}
+
+    def store_hashes(self, entries):
+        # entries: iterable of (filepath, ahash, dhash); files missing from the index are skipped
+        rows = [(to_signed64(ahash), to_signed64(dhash), path) for path, ahash, dhash in entries]
+        if rows:
+            with self.lock:
+                self.conn.executemany("UPDATE files SET ahash = ?, dhash = ? WHERE path = ?", rows)
+                self.conn.commit()
+
+    def remove(self, paths):
+        paths = [(path,) for path in paths]
+        if paths:
+            with self.lock:
+                self.conn.executemany("DELETE FROM files WHERE path = ?", paths)
+                self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_executor(workers, kind='thread'):
+    # Pool used to fan metadata reads out; 'process' sidesteps the GIL for EXIF parsing
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def read_metadata_chunk(filepaths):
+    with instrumentation.timer('scan.metadata'):
+        return [read_photo_metadata(filepath) for filepath in filepaths]
+
+
+def new_scan_stats():
+    # photos yielded, files whose header had to be parsed (and their bytes), directories walked / skipped
+    return {'photos': 0, 'parsed': 0, 'parsed_bytes': 0, 'dirs': 0, 'dirs_skipped': 0}
+
+
+def iter_photo_batches(folder, extensions, index=None, require_date=False, workers=1, executor_kind='thread',
+                       batch_size=200, batch_interval=0.25, chunk_size=16, recursive=False, full_rescan=False,
+                       stats=None):
+    # Scans folder (and its subfolders if recursive) with os.scandir and yields lists of
+    # (filepath, datetime) as they are discovered, so the first page can be shown before the scan
+    # ends. Files whose size and mtime match the index are not opened again; new or changed files
+    # are read in chunks on a worker pool. Without require_date the file mtime is used as fallback.
+    # A directory whose mtime matches the last complete scan is not listed again and its indexed
+    # files are stat'ed directly, since files rewritten in place do not change the directory mtime.
+    # That still costs one stat per photo, so the skip only saves the listing itself (readdir),
+    # which is worth it mainly on network shares and in folders full of non-photo files. A
+    # recursive scan only skips directories whose last scan was recursive too, a flat one knows no
+    # subfolders.
+    # full_rescan ignores the index: every folder is listed and every photo is read again, e.g.
+    # after the metadata reader changed. stats, if given, receives the counters from new_scan_stats().
+    folder = os.path.abspath(folder)
+    if stats is None:
+        stats = new_scan_stats()
+    if index:
+        cached_tree = index.get_tree(folder) if recursive else {folder: index.get_folder(folder)}
+        cached_dirs = index.get_dirs(folder, recursive)
+    else:
+        cached_tree, cached_dirs = {}, {}
+    children = {}  # parent -> cached subdirectories, walked when a directory is skipped
+    for path, (parent, _, _) in cached_dirs.items():
+        children.setdefault(parent, []).append(path)
+    visited_dirs = []  # (dirpath, mtime_ns), committed only once the whole scan completed
+    vanished = []  # indexed files missing from a skipped directory
+    complete = True  # stale entries are only pruned when every directory could be listed
+    pool = create_executor(workers, executor_kind) if workers > 1 else None
+    futures = set()
+    completed = deque()  # filled by pool callbacks
+    batch = []
+    updates = []
+    chunk = []
+    last_yield = time.perf_counter()
+
+    def add(filepath, stat, date_taken):
+        if date_taken:
+            batch.append((filepath, date_taken))
+        elif not require_date:
+            batch.append((filepath, datetime.fromtimestamp(stat.st_mtime)))
+
+    def add_results(files, results):
+        for (filepath, stat), (date_taken, width, height) in zip(files, results):
+            updates.append((filepath, stat.st_size, stat.st_mtime_ns, date_taken, width, height))
+            add(filepath, stat, date_taken)
+            stats['parsed'] += 1
+            stats['parsed_bytes'] += stat.st_size
+
+    def submit_chunk():
+        files = list(chunk)
+        chunk.clear()
+        if pool is None:
+            add_results(files, read_metadata_chunk([filepath for filepath, _ in files]))
+            return
+        future = pool.submit(read_metadata_chunk, [filepath for filepath, _ in files])
+        futures.add(future)
+        future.add_done_callback(lambda f: completed.append((files, f)))
+
+    def drain_completed():
+        while completed:
+            files, future = completed.popleft()
+            futures.discard(future)
+            add_results(files, future.result())
+
+    def take_batch():
+        nonlocal batch, last_yield
+        if index:
+            index.store(updates)
+            updates.clear()
+        ready, batch = batch, []
+        stats['photos'] += len(ready)
+        last_yield = time.perf_counter()
+        return ready
+
+    def list_directory(dirpath, subdirs):
+        # Yields after each entry so batches keep flowing while big folders are listed
+        cached = cached_tree.get(dirpath, {})
+        start = time.perf_counter()  # listing time, excluding the time spent suspended at yield
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirs.append((entry.path, entry.stat(follow_symlinks=False).st_mtime_ns))
+                        continue
+                    if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                        continue
+                    stat = entry.stat()  # cached by scandir on Windows, one lstat elsewhere
+                except OSError:
+                    continue
+                cached_entry = cached.pop(entry.path, None)
+                if not full_rescan and cached_entry and \
+                        cached_entry[0] == stat.st_size and cached_entry[1] == stat.st_mtime_ns:
+                    add(entry.path, stat, cached_entry[2])
+                else:
+                    chunk.append((entry.path, stat))
+                    if len(chunk) >= chunk_size:
+                        submit_chunk()
+                if instrumentation.enabled:
+                    instrumentation.add_time('scan.list', time.perf_counter() - start)
+                yield
+                start = time.perf_counter()
+
+    try:
+        try:
+            stack = [(folder, os.stat(folder).st_mtime_ns)]
+        except OSError:
+            stack = []
+        while stack:
+            dirpath, mtime_ns = stack.pop()
+            subdirs = []
+            stats['dirs'] += 1
+            cached_dir = cached_dirs.get(dirpath)
+            if not full_rescan and cached_dir and cached_dir[1] == mtime_ns and (cached_dir[2] or not recursive):
+                stats['dirs_skipped'] += 1
+                # listing unchanged since the last scan: reuse the indexed entries whose stat still matches
+                for filepath, (size, file_mtime_ns, date_taken, _, _) in cached_tree.pop(dirpath, {}).items():
+                    try:
+                        stat = os.stat(filepath)
+                    except OSError:
+                        vanished.append(filepath)
+                        continue
+                    if stat.st_size == size and stat.st_mtime_ns == file_mtime_ns:
+                        add(filepath, stat, date_taken)
+                    else:
+                        chunk.append((filepath, stat))
+                        if len(chunk) >= chunk_size:
+                            submit_chunk()
+                for subdir in children.get(dirpath, []) if recursive else []:
+                    try:
+                        subdirs.append((subdir, os.stat(subdir).st_mtime_ns))
+                    except OSError:
+                        pass
+            else:
+                try:
+                    for _ in list_directory(dirpath, subdirs):
+                        drain_completed()
+                        if batch and (len(batch) >= batch_size or time.perf_counter() - last_yield >= batch_interval):
+                            yield take_batch()
+                except OSError as e:
+                    print(f"Error scanning {dirpath}: {e}")
+                    complete = False
+                    continue
+            visited_dirs.append((dirpath, mtime_ns))
+            stack.extend(sorted(subdirs, reverse=True))  # depth first, in name order
+            drain_completed()
+            if batch and (len(batch) >= batch_size or time.perf_counter() - last_yield >= batch_interval):
+                yield take_batch()
+        if chunk:
+            submit_chunk()
+
+        while futures or completed:
+            drain_completed()
+            if futures:
+                wait(futures, timeout=batch_interval, return_when=FIRST_COMPLETED)
+                drain_completed()
+            if batch and (len(batch) >= batch_size or time.perf_counter() - last_yield >= batch_interval):
+                yield take_batch()
+        if batch or updates:
+            yield take_batch()
+        if index and complete:
+            # whatever is left in the cached tree is gone from disk
+            index.remove([path for files in cached_tree.values() for path in files] + vanished)
+            visited = {dirpath for dirpath, _ in visited_dirs}
+            index.remove_dirs(path for path in cached_dirs if path not in visited)
+            index.store_dirs(visited_dirs, recursive)
+    finally:
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def scan_photos(folder, extensions, index=None, require_date=False, workers=1, executor_kind='thread',
+                recursive=False, full_rescan=False):
+    # Blocking variant of iter_photo_batches returning the whole [(filepath, datetime)] list
+    return [item for batch in iter_photo_batches(folder, extensions, index, require_date, workers, executor_kind,
+                                                 recursive=recursive, full_rescan=full_rescan)
+            for item in batch]
+
+
+def list_photo_dir(dirpath, extensions):
+    # ({filepath: (size, mtime_ns)}, [subdirectories]) of one directory, stat only, no file is opened
+    files = {}
+    subdirs = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+    return files, subdirs
+
+
+def snapshot_files(folder, extensions, recursive=False):
+    # {filepath: (size, mtime_ns)} of the photos in folder, stat only, no file is opened
+    files = {}
+    stack = [folder]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            listed, subdirs = list_photo_dir(dirpath, extensions)
+        except OSError as e:
+            if dirpath == folder:
+                raise
+            print(f"Error scanning {dirpath}: {e}")
+            continue
+        files.update(listed)
+        if recursive:
+            stack.extend(subdirs)
+    return files
+
+
+class WatchEvents:
+    # watchdog event handler; only remembers which paths changed, FolderWatcher re-stats them
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        if event.is_directory and event.event_type == 'modified':
+            return  # only says its listing changed, the file events carry the details
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        self.watcher.mark_dirty([os.fsdecode(path) for path in paths if path])
+
+
+class FolderWatcher:
+    # Reports photos added, removed or modified in folder after it was loaded, as
+    # callback(added, removed, modified) on the watcher thread: added and modified are
+    # [(filepath, datetime)], removed is [filepath]. Only changed files are re-read and stored in
+    # the index. Uses watchdog when installed, otherwise polls: every poll_interval only directories
+    # whose mtime changed are listed again (one stat per directory), and every full_poll_interval
+    # every photo is stat'ed to catch files rewritten in place.
+    def __init__(self, folder, extensions, callback, index=None, require_date=False, recursive=False,
+                 poll_interval=2.0, full_poll_interval=60.0, settle_delay=0.5):
+        self.folder = os.path.abspath(folder)  # the index stores absolute paths
+        self.extensions = extensions
+        self.callback = callback
+        self.index = index
+        self.require_date = require_date
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.full_poll_interval = full_poll_interval
+        self.dir_listings = {}  # dirpath -> (mtime_ns, files, subdirs) from the last poll
+        self.last_full_poll = 0.0
+        self.settle_delay = settle_delay  # lets a burst of events (a copy in progress) settle into one update
+        self.known = {}  # filepath -> (size, mtime_ns) as last reported
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.observer = None
+        self.thread = None
+
+    @property
+    def mode(self):
+        return 'notify' if self.observer else 'poll'
+
+    def start(self):
+        # The index already holds what the last scan saw, so changes made since then are reported too
+        if self.index:
+            if self.recursive:
+                tree = self.index.get_tree(self.folder)
+            else:
+                tree = {self.folder: self.index.get_folder(self.folder)}
+            self.known = {path: entry[:2] for files in tree.values() for path, entry in files.items()}
+        else:
+            self.known = snapshot_files(self.folder, self.extensions, self.recursive)
+        if Observer is not None:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(WatchEvents(self), self.folder, recursive=self.recursive)
+                self.observer.start()
+            except Exception as e:  # e.g. the inotify watch limit is reached
+                print(f"Change notifications unavailable, polling instead: {e}")
+                self.observer = None
+            else:
+                self.mark_dirty([self.folder])  # catch up with changes made before the observer started
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.observer:
+            self.observer.stop()
+
+    def mark_dirty(self, paths):
+        with self.lock:
+            self.dirty.update(paths)
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.observer:
+                self.wakeup.wait()
+                if self.stopped.wait(self.settle_delay):
+                    break
+                self.wakeup.clear()
+                with self.lock:
+                    dirty, self.dirty = self.dirty, set()
+                current, checked = self.snapshot_paths(dirty)
+            else:
+                if self.stopped.wait(self.poll_interval):
+                    break
+                try:
+                    current = self.poll()
+                except OSError as e:
+                    print(f"Error watching {self.folder}: {e}")
+                    continue
+                checked = None
+            try:
+                self.apply(current, checked)
+            except Exception as e:
+                print(f"Error updating {self.folder}: {e}")
+
+    def poll(self):
+        # Snapshot of the folder reusing the listings of directories whose mtime did not change
+        full = time.monotonic() - self.last_full_poll >= self.full_poll_interval
+        if full:
+            self.last_full_poll = time.monotonic()
+        current = {}
+        listings = {}
+        stack = [self.folder]
+        while stack:
+            dirpath = stack.pop()
+            try:
+                mtime_ns = os.stat(dirpath).st_mtime_ns
+                cached = self.dir_listings.get(dirpath)
+                if not full and cached and cached[0] == mtime_ns:
+                    files, subdirs = cached[1], cached[2]
+                else:
+                    files, subdirs = list_photo_dir(dirpath, self.extensions)
+            except OSError:
+                if dirpath == self.folder:
+                    raise
+                continue
+            listings[dirpath] = (mtime_ns, files, subdirs)
+            current.update(files)
+            if self.recursive:
+                stack.extend(subdirs)
+        self.dir_listings = listings
+        return current
+
+    def snapshot_paths(self, paths):
+        # Re-stats only the paths that had events; a changed directory is listed again as a whole,
+        # which also covers folders moved in or out. Returns (current files, known files checked)
+        current = {}
+        checked = set()
+        root = os.path.join(self.folder, '')
+        for path in paths:
+            if not (path + os.sep).startswith(root):
+                continue
+            is_dir = os.path.isdir(path)
+            if not self.recursive and path != self.folder and (is_dir or os.path.dirname(path) != self.folder):
+                continue  # a flat load only holds the photos directly in folder, not its subfolders
+            prefix = os.path.join(path, '')
+            if is_dir:
+                try:
+                    current.update(snapshot_files(path, self.extensions, self.recursive))
+                except OSError:
+                    pass
+                checked.update(known for known in self.known if known.startswith(prefix) and
+                               (self.recursive or os.path.join(os.path.dirname(known), '') == prefix))
+                continue
+            checked.add(path)
+            if not os.path.exists(path):
+                # a removed folder takes every known photo below it along
+                checked.update(known for known in self.known if known.startswith(prefix))
+                continue
+            if path.lower().endswith(self.extensions):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                current[path] = (stat.st_size, stat.st_mtime_ns)
+        return current, checked
+
+    def apply(self, current, checked=None):
+        # checked: known files covered by current, None when current is a full snapshot
+        if checked is None:
+            checked = self.known.keys()
+        removed = [path for path in checked if path in self.known and path not in current]
+        changed = [path for path, stat in current.items() if self.known.get(path) != stat]
+        if not removed and not changed:
+            return
+        added, modified, updates = [], [], []
+        for filepath in changed:
+            size, mtime_ns = current[filepath]
+            date_taken, width, height = read_photo_metadata(filepath)
+            updates.append((filepath, size, mtime_ns, date_taken, width, height))
+            if not date_taken:
+                if self.require_date:
+                    if filepath in self.known:
+                        removed.append(filepath)
+                    continue
+                date_taken = datetime.fromtimestamp(mtime_ns / 1e9)
+            (modified if filepath in self.known else added).append((filepath, date_taken))
+        if self.index:
+            self.index.store(updates)
+            self.index.remove(path for path in removed if path not in current)
+        for filepath in removed:
+            self.known.pop(filepath, None)
+        self.known.update((filepath, current[filepath]) for filepath in changed)
+        self.callback(added, removed, modified)
+
+
+class SortedPhotoList(list):
+    # photo_data for archives: kept sorted by date while scan batches are merged in
+    def __init__(self, items=()):
+        super().__init__(sorted(items, key=lambda item: item[1]))
+        self.keys = [item[1] for item in self]
+
+    def add_batch(self, batch):
+        # Inserts batch keeping the order stable, returns the lowest index that changed
+        if not batch:
+            return len(self)
+        if len(batch) * 8 > len(self):  # large batch: let Timsort merge the runs
+            first = bisect_right(self.keys, min(item[1] for item in batch))
+            self.extend(batch)
+            self.sort(key=lambda item: item[1])
+            self.keys = [item[1] for item in self]
+            return first
+        first = len(self)
+        for item in batch:
+            position = bisect_right(self.keys, item[1])
+            self.insert(position, item)
+            self.keys.insert(position, item[1])
+            first = min(first, position)
+        return first
+
+    def remove_paths(self, paths):
+        # Drops every entry whose filepath is in paths, returns how many were removed
+        paths = set(paths)
+        kept = [item for item in self if item[0] not in paths]
+        removed = len(self) - len(kept)
+        if removed:
+            self[:] = kept
+            self.keys = [item[1] for item in kept]
+        return removed
+
+
+class DateIndex:
+    # Dates of photo_data in sorted order, so a date range is two bisects instead of a full scan
+    def __init__(self, photo_data):
+        self.photo_data = photo_data
+        if isinstance(photo_data, SortedPhotoList):
+            self.order = None  # already sorted, ranges are plain slices
+            self.dates = [key.date() for key in photo_data.keys]
+        else:
+            self.order = sorted(range(len(photo_data)), key=lambda i: photo_data[i][1])
+            self.dates = [photo_data[i][1].date() for i in self.order]
+
+    def range(self, date_from=None, date_to=None):
+        # Photos dated date_from..date_to inclusive, in photo_data order; either end may be open
+        low = bisect_left(self.dates, date_from) if date_from else 0
+        high = bisect_right(self.dates, date_to) if date_to else len(self.dates)
+        if self.order is None:
+            return self.photo_data[low:high]
+        return [self.photo_data[i] for i in sorted(self.order[low:high])]
+
+    def histogram(self, by='day'):
+        # [(date, count)] per day, or per month keyed by the first of the month
+        if by == 'month':
+            periods = (date.replace(day=1) for date in self.dates)
+        else:
+            periods = iter(self.dates)
+        return [(period, sum(1 for _ in group)) for period, group in groupby(periods)]
+
+
+def image_bytes(img):
+    # Estimated memory held by a decoded image or Tk PhotoImage, 4 bytes per pixel
+    if hasattr(img, 'width') and callable(img.width):  # ImageTk.PhotoImage
+        return img.width() * img.height() * 4
+    return img.width * img.height * 4
+
+
+class LRUCache:
+    # Least recently used cache bounded by entry count and/or estimated bytes
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=image_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            self.evict()
+
+    def resize(self, key):
+        # Re-measures an entry whose value grew or shrank in place, evicting older entries if needed
+        with self.lock:
+            if key not in self.entries:
+                return
+            value, size = self.entries.pop(key)
+            new_size = self.sizeof(value) if self.sizeof else 0
+            self.entries[key] = (value, new_size)
+            self.total_bytes += new_size - size
+            self.evict()
+
+    def evict(self):
+        # Drops least recently used entries over the limits, never the most recent one; holds self.lock
+        while len(self.entries) > 1 and (
+                (self.max_entries and len(self.entries) > self.max_entries) or
+                (self.max_bytes and self.total_bytes > self.max_bytes)):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                value, size = self.entries.pop(key)
+                self.total_bytes -= size
+                return value
+            return None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+THUMBNAIL_STRATEGIES = ('exif', 'draft', 'full')
+
+
+def read_exif_thumbnail(img):
+    # The JPEG preview many cameras embed in EXIF IFD1, or None
+    exif_bytes = img.info.get('exif')
+    if not exif_bytes:
+        return None
+    ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+    offset, length = ifd1.get(0x0201), ifd1.get(0x0202)  # JPEGInterchangeFormat(Length)
+    if not offset or not length:
+        return None
+    start = offset + 6 if exif_bytes.startswith(b'Exif\x00\x00') else offset  # offsets are from the TIFF header
+    preview = Image.open(io.BytesIO(exif_bytes[start:start + length]))
+    preview.load()
+    return preview
+
+
+def fit_size(width, height, size):
+    # Dimensions Image.thumbnail produces for width x height inside the size box
+    scale = min(1.0, size[0] / width, size[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def make_thumbnail(filepath, size=(200, 200), strategy='auto'):
+    # Shrinks the image to fit size, trying the cheapest source first:
+    #   'exif'  - the embedded EXIF preview, if it is big enough and has the same aspect ratio
+    #   'draft' - JPEG DCT scaling, decoding at 1/2, 1/4 or 1/8 of the resolution
+    #   'full'  - decode every pixel, then resample
+    # 'auto' tries them in that order; a single strategy returns None if it does not apply.
+    with Image.open(filepath) as img:
+        target = fit_size(img.width, img.height, size)
+        if strategy in ('auto', 'exif'):
+            with instrumentation.timer('thumbnail.decode'):
+                try:
+                    preview = read_exif_thumbnail(img)
+                except Exception:
+                    preview = None
+            if preview and preview.width >= target[0] and preview.height >= target[1] and \
+                    abs(preview.width / preview.height - img.width / img.height) < 0.02 * img.width / img.height:
+                with instrumentation.timer('thumbnail.resize'):
+                    preview.thumbnail(size)
+                instrumentation.count('thumbnail.source.exif')
+                return preview
+            if strategy == 'exif':
+                return None
+        if strategy in ('auto', 'draft') and img.format == 'JPEG':
+            img.draft(img.mode, target)
+            instrumentation.count('thumbnail.source.draft')
+        elif strategy == 'draft':
+            return None
+        else:
+            instrumentation.count('thumbnail.source.full')
+        with instrumentation.timer('thumbnail.decode'):
+            img.load()
+        with instrumentation.timer('thumbnail.resize'):
+            img.thumbnail(size, reducing_gap=None if strategy == 'full' else 2.0)
+    return img
+
+
+def perceptual_hashes(img):
+    # (aHash, dHash) as 64 bit ints: pixels brighter than the mean of an 8x8 grayscale, and
+    # whether each pixel of a 9x8 grayscale is brighter than its right neighbour. Works on thumbnails.
+    gray = img.convert('L')
+    pixels = list(gray.resize((8, 8), Image.BILINEAR).getdata())
+    mean = sum(pixels) / 64
+    ahash = 0
+    for value in pixels:
+        ahash = ahash << 1 | (value > mean)
+    pixels = list(gray.resize((9, 8), Image.BILINEAR).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = dhash << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return ahash, dhash
+
+
+def hash_chunks(threshold):
+    # (shift, mask) of threshold + 1 disjoint pieces of a 64 bit hash: two hashes within threshold
+    # bits of each other agree exactly on at least one piece (multi-index hashing)
+    pieces = threshold + 1
+    chunks = []
+    start = 0
+    for piece in range(pieces):
+        width = 64 // pieces + (piece < 64 % pieces)
+        chunks.append((start, (1 << width) - 1))
+        start += width
+    return chunks
+
+
+def bucket_keys(threshold):
+    # Both hashes must be within threshold, so a match shares a dHash piece and an aHash piece;
+    # bucketing on the pair keeps buckets small even for large thresholds
+    return [(dhash_chunk, ahash_chunk) for dhash_chunk in hash_chunks(threshold)
+            for ahash_chunk in hash_chunks(threshold)]
+
+
+if np is not None:
+    if hasattr(np, 'bitwise_count'):
+        def popcount(values):
+            return np.bitwise_count(values)
+    else:
+        BYTE_BITS = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+        def popcount(values):
+            return BYTE_BITS[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def union_numpy(parent, first, second):
+    # Joins the groups of every (first, second) pair. parent is kept flat (every entry points at
+    # its root), so roots compare directly; larger roots are hooked onto smaller ones, then the
+    # trees are flattened again by pointer jumping
+    while len(first):
+        first_roots, second_roots = parent[first], parent[second]
+        apart = first_roots != second_roots
+        if not apart.any():
+            break
+        first, second = first[apart], second[apart]
+        first_roots, second_roots = first_roots[apart], second_roots[apart]
+        np.minimum.at(parent, np.maximum(first_roots, second_roots), np.minimum(first_roots, second_roots))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return parent
+
+
+def link_similar_numpy(hashes, threshold):
+    # Group root of each of the distinct (ahash, dhash) pairs
+    ahashes = np.array([ahash for ahash, _ in hashes], dtype=np.uint64)
+    dhashes = np.array([dhash for _, dhash in hashes], dtype=np.uint64)
+    parent = np.arange(len(hashes))
+    for (dhash_shift, dhash_mask), (ahash_shift, ahash_mask) in bucket_keys(threshold):
+        keys = (dhashes >> np.uint64(dhash_shift)) & np.uint64(dhash_mask)
+        ahash_width = ahash_mask.bit_length()
+        if dhash_mask.bit_length() + ahash_width <= 64:  # else the dHash piece alone is the key
+            keys = (keys << np.uint64(ahash_width)) | ((ahashes >> np.uint64(ahash_shift)) & np.uint64(ahash_mask))
+        order = np.argsort(keys)
+        keys = keys[order]
+        # after sorting a bucket is a run; pair every entry with the one `step` places later in
+        # the same run, for growing step, so all candidates are checked without a Python loop per bucket.
+        # Pairs already in one group are skipped and matches are joined right away, so memory stays
+        # proportional to one step's candidates
+        active = np.arange(len(keys) - 1)
+        step = 1
+        while len(active):
+            active = active[active + step < len(keys)]
+            active = active[keys[active + step] == keys[active]]  # runs shorter than step drop out
+            first, second = order[active], order[active + step]
+            apart = parent[first] != parent[second]
+            first, second = first[apart], second[apart]
+            close = ((popcount(dhashes[first] ^ dhashes[second]) <= threshold) &
+                     (popcount(ahashes[first] ^ ahashes[second]) <= threshold))
+            parent = union_numpy(parent, first[close], second[close])
+            step += 1
+    return parent.tolist()
+
+
+def link_similar_python(hashes, threshold):
+    parent = list(range(len(hashes)))
+
+    def find(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    for (dhash_shift, dhash_mask), (ahash_shift, ahash_mask) in bucket_keys(threshold):
+        buckets = defaultdict(list)
+        for position, (ahash, dhash) in enumerate(hashes):
+            buckets[dhash >> dhash_shift & dhash_mask, ahash >> ahash_shift & ahash_mask].append(position)
+        for members in buckets.values():
+            for offset, first in enumerate(members):
+                for second in members[offset + 1:]:
+                    first_root, second_root = find(first), find(second)
+                    if first_root != second_root and \
+                            bin(hashes[first][1] ^ hashes[second][1]).count('1') <= threshold and \
+                            bin(hashes[first][0] ^ hashes[second][0]).count('1') <= threshold:
+                        parent[max(first_root, second_root)] = min(first_root, second_root)
+    return [find(position) for position in range(len(hashes))]
+
+
+def find_duplicate_groups(hashes, threshold=6):
+    # hashes: [(ahash, dhash)]; returns lists of positions whose aHash and dHash both differ in at
+    # most threshold bits, joined transitively. Identical hashes (exact copies, black frames) are
+    # collapsed first; then only hashes sharing a bucket are compared, so the work grows with the
+    # number of similar photos rather than n^2. Higher thresholds split the hash into smaller
+    # pieces and compare more candidates
+    if len(hashes) < 2:
+        return []
+    slots = {}
+    members = []  # positions sharing each distinct hash
+    for position, pair in enumerate(hashes):
+        slot = slots.setdefault(pair, len(slots))
+        if slot == len(members):
+            members.append([])
+        members[slot].append(position)
+    distinct = list(slots)
+    if np is not None:
+        roots = link_similar_numpy(distinct, threshold)
+    else:
+        roots = link_similar_python(distinct, threshold)
+    groups = defaultdict(list)
+    for slot, positions in enumerate(members):
+        groups[roots[slot]].extend(positions)
+    return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda group: group[0])
+
+
+class ImagePyramid:
+    # Multi-resolution copies of one image for the full size viewer, level k being 1/2**k of the
+    # original. Levels are decoded on first use: JPEG levels up to 1/8 straight from the file via
+    # DCT scaling, others by reducing the nearest finer level, so the original is only decoded
+    # once the user zooms in far enough to need it.
+    def __init__(self, filepath=None, image=None):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.levels = {}
+        self.transposes = []  # rotations applied so far, replayed on levels decoded later
+        if image is not None:
+            self.size = image.size
+            self.format = image.format
+            self.levels[0] = image
+        else:
+            with Image.open(filepath) as img:
+                self.size = img.size
+                self.format = img.format
+        self.max_level = 0
+        while max(self.size) >> (self.max_level + 1) >= 64:
+            self.max_level += 1
+
+    def level_for(self, scale):
+        # Coarsest level that still has at least scale pixels per original pixel
+        level = 0
+        while level < self.max_level and 1 / 2 ** (level + 1) >= scale:
+            level += 1
+        return level
+
+    def decode(self, level):
+        with Image.open(self.filepath) as img:
+            if level and img.format == 'JPEG':
+                img.draft(img.mode, (-(-img.width // 2 ** level), -(-img.height // 2 ** level)))
+            img.load()
+        for method in self.transposes:
+            img = img.transpose(method)
+        return img
+
+    def get_level(self, level):
+        with self.lock:
+            if level not in self.levels:
+                finer = [decoded for decoded in self.levels if decoded < level]
+                if finer:
+                    source = self.levels[max(finer)]
+                else:
+                    source = self.decode(level)
+                # draft only scales by 1/2, 1/4 or 1/8, reduce covers the rest
+                factor = max(1, round(source.width / (self.size[0] / 2 ** level)))
+                self.levels[level] = source.reduce(factor) if factor > 1 else source
+            return self.levels[level]
+
+    def render(self, scale, box, out_size):
+        # Resamples the box (in original pixel coordinates) to out_size from the best level
+        level = self.get_level(self.level_for(scale))
+        fx = level.width / self.size[0]
+        fy = level.height / self.size[1]
+        left, top, right, bottom = box
+        return level.resize(out_size, Image.Resampling.BILINEAR,
+                            box=(left * fx, top * fy, right * fx, bottom * fy))
+
+    def memory_bytes(self):
+        return sum(image_bytes(img) for img in self.levels.values())
+
+    def transpose(self, method):
+        with self.lock:
+            self.transposes.append(method)
+            self.levels = {level: img.transpose(method) for level, img in self.levels.items()}
+            if method in (Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270):
+                self.size = (self.size[1], self.size[0])
+
+
+class ThumbnailStore:
+    # Thumbnails saved as small files in the cache folder, shared across sessions.
+    # Keyed by path + mtime + size + thumbnail dimension so edited files get a new entry;
+    # the entries left behind are removed by prune(), least recently used first.
+    def __init__(self, root=None, size=(200, 200), max_bytes=2 * 1024 * 1024 * 1024):
+        self.root = root or os.path.join(get_cache_dir(), 'thumbnails')
+        self.size = size
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, filepath, stat):
+        raw = f"{os.path.abspath(filepath)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}"
+        return hashlib.sha1(raw.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def entry_path(self, key, extension):
+        return os.path.join(self.root, key[:2], key + extension)
+
+    def has(self, filepath, stat=None):
+        try:
+            key = self.key(filepath, stat or os.stat(filepath))
+        except OSError:
+            return False
+        return any(os.path.exists(self.entry_path(key, extension)) for extension in ('.jpg', '.png'))
+
+    def get(self, filepath, stat=None):
+        try:
+            key = self.key(filepath, stat or os.stat(filepath))
+        except OSError:
+            return None
+        for extension in ('.jpg', '.png'):
+            try:
+                path = self.entry_path(key, extension)
+                with Image.open(path) as img:
+                    img.load()
+                try:
+                    os.utime(path)  # the file mtime doubles as last use for prune()
+                except OSError:
+                    pass
+                return img
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Error reading cached thumbnail for {filepath}: {e}")
+                return None
+        return None
+
+    def put(self, filepath, img, stat=None):
+        try:
+            key = self.key(filepath, stat or os.stat(filepath))
+            # JPEG for opaque thumbnails, PNG keeps transparency and palettes intact
+            if img.mode in ('RGB', 'L'):
+                extension, save_args = '.jpg', {'format': 'JPEG', 'quality': 85}
+            else:
+                extension, save_args = '.png', {'format': 'PNG'}
+            path = self.entry_path(key, extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            img.save(temp_path, **save_args)
+            os.replace(temp_path, path)  # readers never see a half written file
+        except Exception as e:
+            print(f"Error caching thumbnail for {filepath}: {e}")
+
+    def prune(self, max_bytes=None):
+        # Deletes the least recently used thumbnails until the store fits in max_bytes, plus
+        # temporary files left by interrupted writes. Returns (files removed, bytes freed)
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        removed = freed = 0
+        stale = time.time() - 3600
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    if filename.endswith('.tmp') and stat.st_mtime < stale:
+                        os.remove(path)
+                        removed += 1
+                        freed += stat.st_size
+                        continue
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+def format_throughput(count, size, elapsed):
+    elapsed = max(elapsed, 1e-9)
+    return f"{count / elapsed:.1f} files/s, {size / 1024 / 1024 / elapsed:.1f} MB/s"
+
+
+def command_index(args):
+    index = MetadataIndex(args.db)
+    stats = new_scan_stats()
+    start = time.perf_counter()
+    for _ in iter_photo_batches(args.folder, IMAGE_EXTENSIONS, index, require_date=False, workers=args.workers,
+                                executor_kind=args.executor, recursive=not args.flat, full_rescan=args.full,
+                                stats=stats):
+        pass
+    elapsed = time.perf_counter() - start
+    index.close()
+    print(f"Indexed {stats['photos']} photos in {stats['dirs']} folders ({stats['dirs_skipped']} unchanged) "
+          f"in {elapsed:.2f}s")
+    print(f"Parsed {stats['parsed']} new or changed files, {stats['parsed_bytes'] / 1024 / 1024:.1f} MB: "
+          f"{format_throughput(stats['parsed'], stats['parsed_bytes'], elapsed)}")
+    return 0
+
+
+def command_thumbs(args):
+    index = MetadataIndex(args.db)
+    store = ThumbnailStore(args.store, (args.size, args.size))
+    photos = scan_photos(args.folder, IMAGE_EXTENSIONS, index, workers=args.workers, recursive=not args.flat)
+    index.close()
+    counts = {'created': 0, 'cached': 0, 'failed': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    def generate(filepath):
+        try:
+            stat = os.stat(filepath)
+            if store.has(filepath, stat):
+                result = 'cached'
+            else:
+                store.put(filepath, make_thumbnail(filepath, store.size), stat)
+                result = 'created'
+        except Exception as e:
+            print(f"Error creating thumbnail for {filepath}: {e}")
+            result, stat = 'failed', None
+        with lock:
+            counts[result] += 1
+            if result == 'created':
+                counts['bytes'] += stat.st_size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(generate, [filepath for filepath, _ in photos]))
+    elapsed = time.perf_counter() - start
+    print(f"{len(photos)} photos: {counts['created']} thumbnails created, {counts['cached']} already cached, "
+          f"{counts['failed']} failed in {elapsed:.2f}s")
+    print(f"Decoded {counts['bytes'] / 1024 / 1024:.1f} MB: "
+          f"{format_throughput(counts['created'], counts['bytes'], elapsed)}")
+    removed, freed = store.prune(args.max_cache_mb * 1024 * 1024)
+    if removed:
+        print(f"Pruned {removed} old thumbnails ({freed / 1024 / 1024:.1f} MB)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='photo_viewer', description="Pre-warm the Photo Viewer caches")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    index_parser = subparsers.add_parser('index', help="scan a folder into the metadata index")
+    thumbs_parser = subparsers.add_parser('thumbs', help="generate thumbnails for a folder")
+    for subparser in (index_parser, thumbs_parser):
+        subparser.add_argument('folder')
+        subparser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        subparser.add_argument('--flat', action='store_true', help="don't descend into subfolders")
+        subparser.add_argument('--db', help="metadata index file (default: in the user cache folder)")
+    index_parser.add_argument('--executor', choices=('thread', 'process'), default='thread')
+    index_parser.add_argument('--full', action='store_true', help="list every folder and re-read every file, ignoring the index")
+    thumbs_parser.add_argument('--size', type=int, default=200, help="thumbnail box in pixels")
+    thumbs_parser.add_argument('--store', help="thumbnail folder (default: in the user cache folder)")
+    thumbs_parser.add_argument('--max-cache-mb', type=int, default=2048,
+                               help="least recently used thumbnails beyond this are deleted")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.folder):
+        parser.error(f"not a folder: {args.folder}")
+    return command_index(args) if args.command == 'index' else command_thumbs(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
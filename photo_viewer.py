@@ -1,10 +1,36 @@
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # headless commands, e.g. photo_viewer.py index <dir>, run before Tk is imported so they work on servers without it
+    from photo_core import main
+    sys.exit(main())
+
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ExifTags
+from tkinter import ttk, filedialog, messagebox, simpledialog
+from PIL import Image, ImageTk
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
 import subprocess
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from photo_core import (IMAGE_EXTENSIONS, MetadataIndex, ThumbnailStore, ImagePyramid, LRUCache, SortedPhotoList,
+                        FolderWatcher, perceptual_hashes, find_duplicate_groups,
+                        DateIndex, iter_photo_batches, read_photo_metadata, make_thumbnail, instrumentation)
+
+
+class GridTile:
+    # One reusable cell of the scrolling grid, rebound to whichever photo scrolls into its slot
+    def __init__(self, canvas, width, height):
+        self.frame = ttk.Frame(canvas)
+        self.image_label = ttk.Label(self.frame, compound=tk.CENTER)
+        self.image_label.pack()
+        self.name_label = ttk.Label(self.frame)
+        self.name_label.pack()
+        self.window = canvas.create_window(0, 0, window=self.frame, anchor=tk.NW, width=width, height=height,
+                                           state='hidden')
+        self.filepath = None
 
 
 class PhotoViewerApp:
@@ -18,12 +44,40 @@ class PhotoViewerApp:
         self.photos_per_page = 12  # Initial number of photos per page
         self.grid_cols = 4  # Initial grid columns
         self.loading_label = None  # To show loading message
-        self.filtered_date = None  # date filtering
-        self.image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp')
+        self.date_from = None  # date range filtering, both ends inclusive
+        self.date_to = None
+        self.photo_data_version = 0  # bumped whenever photo_data changes, invalidates the views below
+        self.date_index = None
+        self.filtered_view = None  # (version, date_from, date_to, photos)
+        self.image_extensions = IMAGE_EXTENSIONS
         self.sort_by_date = True
         self.full_size_window = None
-        self.thumbnail_cache = {}  # Dictionary to store thumbnails
-        self.current_full_size_image = None  # To store the last opened full size image
+        # decoded PIL thumbnails, and the Tk PhotoImage wrappers for recently shown ones
+        self.thumbnail_cache = LRUCache(max_entries=5000, max_bytes=256 * 1024 * 1024)
+        self.photo_image_cache = LRUCache(max_entries=200)
+        self.thumbnail_store = None  # on-disk thumbnails, opened lazily
+        # thumbnails are decoded on worker threads and handed to the Tk thread with root.after
+        self.thumbnail_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        self.thumbnail_requests = {}  # filepath -> Future still queued or running
+        self.pending_tiles = {}  # filepath -> labels on the current page waiting for it
+        # scrolling grid: a canvas with a fixed pool of tiles bound to the visible rows only
+        self.view_mode = tk.StringVar(value='scroll')  # 'scroll' or 'pages'
+        self.grid_canvas = None
+        self.grid_tiles = []
+        self.tile_width = 220
+        self.tile_height = 240
+        self.current_pyramid = None  # ImagePyramid of the last opened full size image
+        self.render_pending = False
+        self.viewer_filepath = None
+        self.viewer_index = 0  # position of viewer_filepath in the filtered photos
+        self.viewer_info_vars = []
+        # decoded, screen-fitted images for the viewer; neighbours are decoded ahead on preload_pool
+        self.viewer_cache = LRUCache(max_entries=8, max_bytes=768 * 1024 * 1024,
+                                     sizeof=lambda entry: entry[0].memory_bytes())
+        self.preload_pool = ThreadPoolExecutor(max_workers=1)
+        self.preload_requests = {}  # filepath -> Future
+        self.viewer_fit_size = (int(self.root.winfo_screenwidth() * 0.8),
+                                int(self.root.winfo_screenheight() * 0.8) - 150)
         self.zoom_level = 1.0  # zoom level
         self.zoom_bar_width = 200  # Initial width of zoom bar
         self.zoom_percentage_var = tk.StringVar(value="100%")
@@ -38,6 +92,14 @@ class PhotoViewerApp:
         self.current_zoom_image = None  # stores the current zoom image
         self.canvas = None
         self.canvas_image = None
+        self.metadata_index = None  # opened lazily on the first scan
+        self.scan_workers = min(8, os.cpu_count() or 1)  # threads used to read metadata
+        self.load_generation = 0  # bumped on every open so stale scan batches can be dropped
+        self.loading_in_progress = False
+        self.watcher = None  # FolderWatcher applying changes on disk to the loaded photos
+        self.watch_var = tk.BooleanVar(value=False)
+        self.photo_hashes = {}  # filepath -> (ahash, dhash), for photos the metadata index can't hold
+        self.duplicate_view = None  # (photos, {filepath: group number}) while duplicates are shown
         # UI elements
         self.create_widgets()
 
@@ -47,7 +109,35 @@ class PhotoViewerApp:
         file_menu = tk.Menu(menu_bar, tearoff=0)
         file_menu.add_command(label="Open Archive", command=self.open_archive)
         file_menu.add_command(label="Open Folder", command=self.open_folder)
+        file_menu.add_command(label="Full Rescan", command=self.full_rescan)
+        file_menu.add_checkbutton(label="Watch for Changes", variable=self.watch_var, command=self.toggle_watch)
         menu_bar.add_cascade(label="File", menu=file_menu)
+        settings_menu = tk.Menu(menu_bar, tearoff=0)
+        settings_menu.add_command(label="Scan Workers...", command=self.set_scan_workers)
+        settings_menu.add_command(label="Cache Statistics", command=self.show_cache_stats)
+        menu_bar.add_cascade(label="Settings", menu=settings_menu)
+        view_menu = tk.Menu(menu_bar, tearoff=0)
+        view_menu.add_radiobutton(label="Scrolling Grid", variable=self.view_mode, value='scroll',
+                                  command=self.change_view_mode)
+        view_menu.add_radiobutton(label="Pages", variable=self.view_mode, value='pages',
+                                  command=self.change_view_mode)
+        menu_bar.add_cascade(label="View", menu=view_menu)
+        tools_menu = tk.Menu(menu_bar, tearoff=0)
+        tools_menu.add_command(label="Find Duplicates...", command=self.find_duplicates)
+        menu_bar.add_cascade(label="Tools", menu=tools_menu)
+        debug_menu = tk.Menu(menu_bar, tearoff=0)
+        self.instrumentation_var = tk.BooleanVar(value=instrumentation.enabled)
+        debug_menu.add_checkbutton(label="Enable Instrumentation", variable=self.instrumentation_var,
+                                   command=self.toggle_instrumentation)
+        debug_menu.add_command(label="Show Stats", command=self.show_stats_panel)
+        debug_menu.add_command(label="Export Stats...", command=self.export_stats)
+        debug_menu.add_command(label="Reset Stats", command=instrumentation.reset)
+        profile_menu = tk.Menu(debug_menu, tearoff=0)
+        for label, name in (("Loading Photos", 'scan.total'), ("Grid Display", 'grid.display'),
+                            ("Thumbnail", 'thumbnail.load'), ("Zoom", 'viewer.zoom')):
+            profile_menu.add_command(label=label, command=lambda name=name: self.profile_next(name))
+        debug_menu.add_cascade(label="Profile Next Operation", menu=profile_menu)
+        menu_bar.add_cascade(label="Debug", menu=debug_menu)
         self.root.config(menu=menu_bar)
 
         # Control Frame (Date sort, grid size and pagination)
@@ -59,6 +149,13 @@ class PhotoViewerApp:
         self.date_filter_var = tk.StringVar()
         self.date_filter_entry = ttk.Entry(control_frame, textvariable=self.date_filter_var, width=12)
         self.date_filter_entry.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(control_frame, text="To (optional):").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        self.date_to_var = tk.StringVar()
+        ttk.Entry(control_frame, textvariable=self.date_to_var, width=12).grid(row=1, column=1, padx=5, pady=5,
+                                                                               sticky=tk.W)
+        ttk.Button(control_frame, text="Date Histogram", command=self.show_date_histogram).grid(row=1, column=2,
+                                                                                                padx=5, pady=5,
+                                                                                                sticky=tk.W)
         ttk.Button(control_frame, text="Filter by Date", command=self.filter_by_date).grid(row=0, column=2, padx=5,
                                                                                            pady=5, sticky=tk.W)
         ttk.Button(control_frame, text="Reset Filter", command=self.reset_filter).grid(row=0, column=3, padx=5, pady=5,
@@ -75,7 +172,7 @@ class PhotoViewerApp:
         # Pagination Control
         ttk.Label(control_frame, text="Photos per page:").grid(row=0, column=7, padx=5, pady=5, sticky=tk.W)
         self.photos_per_page_var = tk.IntVar(value=self.photos_per_page)
-        photos_per_page_spinbox = ttk.Spinbox(control_frame, from_=1, to=24, textvariable=self.photos_per_page_var,
+        photos_per_page_spinbox = ttk.Spinbox(control_frame, from_=1, to=200, textvariable=self.photos_per_page_var,
                                               width=3)
         photos_per_page_spinbox.grid(row=0, column=8, padx=5, pady=5, sticky=tk.W)
         ttk.Button(control_frame, text="Set Photos per Page", command=self.update_photos_per_page).grid(row=0, column=9,
@@ -89,25 +186,59 @@ class PhotoViewerApp:
         ttk.Button(control_frame, text="Next", command=self.next_page).grid(row=0, column=12, padx=5, pady=5,
                                                                             sticky=tk.W)
 
+        self.placeholder_image = tk.PhotoImage(width=200, height=200)  # blank tile until the thumbnail arrives
+
         # Photo Display Frame
         self.photo_frame = ttk.Frame(self.root, padding=10)
         self.photo_frame.pack(fill=tk.BOTH, expand=True)
 
     def open_archive(self):
-        self.archive_path = filedialog.askdirectory(title="Select Photo Archive Folder")
+        self.archive_path = self.ask_folder("Select Photo Archive Folder")
         self.sort_by_date = True
         if self.archive_path:
             self.start_loading_photos()
 
     def open_folder(self):
-        self.archive_path = filedialog.askdirectory(title="Select Photo Folder")
+        self.archive_path = self.ask_folder("Select Photo Folder")
         self.sort_by_date = False
         if self.archive_path:
             self.start_loading_photos()
 
-    def start_loading_photos(self):
+    def ask_folder(self, title):
+        # Absolute and with native separators (askdirectory uses '/' on Windows), matching the
+        # paths the scan stores in the metadata index
+        folder = filedialog.askdirectory(title=title)
+        return os.path.abspath(folder) if folder else None
+
+    def full_rescan(self):
+        # Lists every folder and re-reads every photo, ignoring the metadata index
+        if self.archive_path:
+            self.start_loading_photos(full_rescan=True)
+
+    def set_scan_workers(self):
+        workers = simpledialog.askinteger("Scan Workers", "Number of threads used to read photo metadata:",
+                                          initialvalue=self.scan_workers, minvalue=1, maxvalue=64,
+                                          parent=self.root)
+        if workers:
+            self.scan_workers = workers
+
+    def start_loading_photos(self, full_rescan=False):
+        self.load_generation += 1  # batches from an older scan are ignored
+        self.loading_in_progress = True
+        self.stop_watching()
+        self.photo_data = SortedPhotoList() if self.sort_by_date else []
+        self.photo_data_version += 1
+        self.current_page = 1
+        self.date_from = self.date_to = None
+        self.duplicate_view = None
+        self.photo_hashes = {}
+        self.cancel_thumbnail_requests()
+        self.thumbnail_cache.clear()
+        self.photo_image_cache.clear()
+        self.viewer_cache.clear()
+        self.clear_photo_frame()
         self.show_loading_indicator("Loading photos...")
-        threading.Thread(target=self.load_photos, daemon=True).start()
+        threading.Thread(target=self.load_photos, args=(self.load_generation, full_rescan), daemon=True).start()
 
     def show_loading_indicator(self, text):
         if self.loading_label:
@@ -122,69 +253,172 @@ class PhotoViewerApp:
             self.loading_label = None
 
     def extract_date(self, image_path):
-        try:
-            img = Image.open(image_path)
-            exif_data = img._getexif()
-            if exif_data:
-                for tag_id, tag_value in exif_data.items():
-                    tag = ExifTags.TAGS.get(tag_id, tag_id)
-                    if tag == 'DateTimeOriginal':
-                        date_str = tag_value.split(' ')[0]
-                        return datetime.strptime(date_str, '%Y:%m:%d')
-            return None
-        except Exception as e:
-            print(f"Error extracting date from {image_path}: {e}")
-            return None
+        return read_photo_metadata(image_path)[0]
 
     def get_file_modification_date(self, filepath):
         timestamp = os.path.getmtime(filepath)
         return datetime.fromtimestamp(timestamp)
 
-    def load_photos(self):
-        self.photo_data = []
+    def get_metadata_index(self):
+        if self.metadata_index is None:
+            try:
+                self.metadata_index = MetadataIndex()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Metadata index unavailable, scanning without it: {e}")
+        return self.metadata_index
+
+    @instrumentation.timed('scan.total')
+    def load_photos(self, generation, full_rescan=False):
+        # Runs on the loader thread; batches are merged into photo_data on the Tk thread
         if self.archive_path:
-            for filename in os.listdir(self.archive_path):
-                if filename.lower().endswith(self.image_extensions):
-                    filepath = os.path.join(self.archive_path, filename)
-
-                    date_taken = self.extract_date(filepath)
-                    if self.sort_by_date:  # if archive
-                        if date_taken:
-                            self.photo_data.append((filepath, date_taken))
-                    else:  # if folder
-                        if date_taken:
-                            self.photo_data.append((filepath, date_taken))
-                        else:
-                            file_date = self.get_file_modification_date(filepath)
-                            self.photo_data.append((filepath, file_date))
-
-        if self.sort_by_date:
-            self.photo_data.sort(key=lambda item: item[1])
-        self.current_page = 1
-        self.filtered_date = None
-        self.thumbnail_cache = {}
-        self.root.after(0, self.display_photos)
-        self.root.after(0, self.hide_loading_indicator)
+            # archives are walked recursively and only keep photos with an EXIF date,
+            # folders are flat and fall back to the file mtime
+            batches = iter_photo_batches(self.archive_path, self.image_extensions, self.get_metadata_index(),
+                                         require_date=self.sort_by_date, workers=self.scan_workers,
+                                         recursive=self.sort_by_date, full_rescan=full_rescan)
+            try:
+                for batch in batches:
+                    if generation != self.load_generation:
+                        break
+                    self.root.after(0, self.add_photo_batch, generation, batch)
+            finally:
+                batches.close()
+        self.root.after(0, self.finish_loading, generation)
+
+    def add_photo_batch(self, generation, batch):
+        if generation != self.load_generation:
+            return
+        first_page = not self.photo_data
+        page_start = (self.current_page - 1) * self.photos_per_page
+        page_end = page_start + self.photos_per_page
+        shown = self.get_filtered_photos()[page_start:page_end]
+        with instrumentation.timer('scan.sort'):
+            if isinstance(self.photo_data, SortedPhotoList):
+                self.photo_data.add_batch(batch)
+            else:
+                self.photo_data.extend(batch)
+        self.photo_data_version += 1
+        # only rebuild the grid when the visible page actually changed; the scrolling
+        # grid just rebinds the tiles whose photo moved
+        if first_page or self.view_mode.get() == 'scroll' or \
+                self.get_filtered_photos()[page_start:page_end] != shown:
+            self.display_photos()
+        else:
+            self.update_page_label()
+
+    def finish_loading(self, generation):
+        if generation != self.load_generation:
+            return
+        self.loading_in_progress = False
+        self.hide_loading_indicator()
+        if self.photo_data:
+            self.update_page_label()
+        else:
+            self.display_photos()
+        if self.watch_var.get():
+            self.start_watching()
+
+    def toggle_watch(self):
+        if not self.watch_var.get():
+            self.stop_watching()
+        elif not self.loading_in_progress:  # otherwise finish_loading starts it
+            self.start_watching()
+
+    def start_watching(self):
+        self.stop_watching()
+        if not self.archive_path:
+            return
+        generation = self.load_generation
+        self.watcher = FolderWatcher(self.archive_path, self.image_extensions,
+                                     lambda *changes: self.root.after(0, self.apply_changes, generation, *changes),
+                                     self.get_metadata_index(), require_date=self.sort_by_date,
+                                     recursive=self.sort_by_date)
+        try:
+            self.watcher.start()
+        except OSError as e:
+            self.watcher = None
+            messagebox.showerror("Error", f"Error watching folder: {e}")
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def apply_changes(self, generation, added, removed, modified):
+        # Merges a watcher delta into photo_data; only photos whose file changed lose their
+        # cached thumbnails, and the grid is only rebuilt when the visible page is affected
+        if generation != self.load_generation:
+            return
+        changed = set(removed) | {filepath for filepath, _ in modified}
+        if self.duplicate_view:
+            self.duplicate_view = ([item for item in self.duplicate_view[0] if item[0] not in changed],
+                                   self.duplicate_view[1])
+        for filepath in changed:
+            self.photo_hashes.pop(filepath, None)
+            self.thumbnail_cache.pop(filepath)
+            self.photo_image_cache.pop(filepath)
+            self.viewer_cache.pop(filepath)
+            future = self.thumbnail_requests.pop(filepath, None)
+            if future:
+                future.cancel()
+                self.pending_tiles.pop(filepath, None)
+        page_start = (self.current_page - 1) * self.photos_per_page
+        page_end = page_start + self.photos_per_page
+        shown = self.get_filtered_photos()[page_start:page_end]
+        if isinstance(self.photo_data, SortedPhotoList):
+            self.photo_data.remove_paths(changed)
+            self.photo_data.add_batch(added + modified)
+        else:
+            self.photo_data[:] = [item for item in self.photo_data if item[0] not in changed]
+            self.photo_data.extend(added + modified)
+        self.photo_data_version += 1
+        for tile in self.grid_tiles:
+            if tile.filepath in changed:
+                tile.filepath = None  # rebound with the new thumbnail by refresh_visible_tiles
+        if self.view_mode.get() == 'scroll' or not shown or \
+                self.get_filtered_photos()[page_start:page_end] != shown or \
+                any(item[0] in changed for item in shown):
+            self.display_photos()
+        else:
+            self.update_page_label()
+        if self.full_size_window and self.full_size_window.winfo_exists() and self.viewer_filepath in changed \
+                and self.viewer_filepath not in removed:
+            try:
+                self.show_full_size_image(self.viewer_filepath)
+            except Exception as e:
+                print(f"Error reloading {self.viewer_filepath}: {e}")
 
     def filter_by_date(self):
-        filter_date_str = self.date_filter_var.get()
+        # A single date shows that day, with "To" filled in it is an inclusive range
+        filter_date_str = self.date_filter_var.get().strip()
+        date_to_str = self.date_to_var.get().strip()
         try:
-            if filter_date_str:
-                self.filtered_date = datetime.strptime(filter_date_str, '%Y-%m-%d').date()
-            else:
-                self.filtered_date = None
+            date_from = datetime.strptime(filter_date_str, '%Y-%m-%d').date() if filter_date_str else None
+            date_to = datetime.strptime(date_to_str, '%Y-%m-%d').date() if date_to_str else date_from
         except ValueError:
             messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD.")
             return
-        self.current_page = 1
-        self.display_photos()
+        self.set_date_range(date_from, date_to)
 
     def reset_filter(self):
         self.date_filter_var.set("")
-        self.filtered_date = None
-        self.current_page = 1
+        self.date_to_var.set("")
+        self.set_date_range(None, None)
+
+    def set_date_range(self, date_from, date_to):
+        self.date_from = date_from
+        self.date_to = date_to
+        if self.duplicate_view:
+            self.duplicate_view = None
+            self.clear_photo_frame()  # tiles captioned with their group
+        self.go_to_start()
         self.display_photos()
 
+    def go_to_start(self):
+        self.current_page = 1
+        if self.grid_canvas is not None:
+            self.grid_canvas.yview_moveto(0)
+
     def update_grid(self):
         self.grid_cols = self.grid_cols_var.get()
         self.display_photos()
@@ -194,20 +428,183 @@ class PhotoViewerApp:
         self.current_page = 1
         self.display_photos()
 
-    def get_thumbnail(self, filepath):
-        if filepath in self.thumbnail_cache:
-            return self.thumbnail_cache[filepath]
+    @instrumentation.timed('thumbnail.load')
+    def load_thumbnail_image(self, filepath, keep=True):
+        # PIL thumbnail from memory, the disk store or the original; safe to call from worker threads.
+        # keep=False leaves the memory cache alone, for bulk work like hashing
+        img = self.thumbnail_cache.get(filepath)
+        if img is None:
+            store = self.get_thumbnail_store()
+            stat = os.stat(filepath)
+            with instrumentation.timer('thumbnail.store_read'):
+                img = store.get(filepath, stat) if store else None
+            if img is None:
+                img = make_thumbnail(filepath)
+                if store:
+                    with instrumentation.timer('thumbnail.store_write'):
+                        store.put(filepath, img, stat)
+                instrumentation.count('thumbnail.generated')
+            else:
+                instrumentation.count('thumbnail.disk_hit')
+            if keep:
+                self.thumbnail_cache.put(filepath, img)
         else:
-            img = Image.open(filepath)
-            img.thumbnail((200, 200))
-            photo_image = ImageTk.PhotoImage(img)
-            self.thumbnail_cache[filepath] = photo_image
-            return photo_image
-
-    def display_photos(self):
+            instrumentation.count('thumbnail.memory_hit')
+        return img
 
+    def get_thumbnail(self, filepath):
+        photo_image = self.photo_image_cache.get(filepath)
+        if photo_image is None:
+            img = self.load_thumbnail_image(filepath)
+            with instrumentation.timer('thumbnail.photoimage'):
+                photo_image = ImageTk.PhotoImage(img)
+            self.photo_image_cache.put(filepath, photo_image)
+        return photo_image
+
+    def request_thumbnail(self, filepath, label=None):
+        # Fills label with the thumbnail once a worker has decoded it; without a label the
+        # thumbnail is only prefetched into the cache
+        if label is not None:
+            label.filepath = filepath  # tiles get reused, deliver only to labels still showing this photo
+            photo_image = self.photo_image_cache.get(filepath)
+            if photo_image is None and filepath in self.thumbnail_cache:
+                photo_image = self.get_thumbnail(filepath)
+            if photo_image is not None:
+                label.config(image=photo_image)
+                label.image = photo_image
+                return
+            self.pending_tiles.setdefault(filepath, []).append(label)
+        elif filepath in self.thumbnail_cache:
+            return
+        if filepath not in self.thumbnail_requests:
+            future = self.thumbnail_pool.submit(self.load_thumbnail_image, filepath)
+            self.thumbnail_requests[filepath] = future
+            future.add_done_callback(lambda f: self.root.after(0, self.deliver_thumbnail, filepath, f))
+
+    def deliver_thumbnail(self, filepath, future):
+        if self.thumbnail_requests.get(filepath) is not future:
+            return  # superseded, e.g. the file changed: the tiles wait for the newer request
+        del self.thumbnail_requests[filepath]
+        labels = [label for label in self.pending_tiles.pop(filepath, [])
+                  if label.winfo_exists() and label.filepath == filepath]
+        if future.cancelled() or not labels:
+            return
+        try:
+            with instrumentation.timer('thumbnail.photoimage'):
+                photo_image = ImageTk.PhotoImage(future.result())
+        except Exception as e:
+            print(f"Error displaying image {filepath}: {e}")
+            for label in labels:
+                label.config(image='', text="Unreadable")
+            return
+        self.photo_image_cache.put(filepath, photo_image)
+        for label in labels:
+            label.config(image=photo_image)
+            label.image = photo_image
+
+    def cancel_thumbnail_requests(self, keep=()):
+        # Drops queued decodes that are no longer wanted; ones already running just finish into the cache
+        keep = set(keep)
+        for filepath, future in list(self.thumbnail_requests.items()):
+            if filepath not in keep and future.cancel():
+                del self.thumbnail_requests[filepath]
+                self.pending_tiles.pop(filepath, None)
+
+    def get_thumbnail_store(self):
+        if self.thumbnail_store is None:
+            try:
+                self.thumbnail_store = ThumbnailStore()
+                # once per session, in the background: drop the least recently used thumbnails over the cap
+                threading.Thread(target=self.thumbnail_store.prune, daemon=True).start()
+            except OSError as e:
+                print(f"Thumbnail store unavailable: {e}")
+                self.thumbnail_store = False  # don't retry on every thumbnail
+        return self.thumbnail_store
+
+    def toggle_instrumentation(self):
+        instrumentation.enabled = self.instrumentation_var.get()
+
+    def profile_next(self, name):
+        # the profile is written from whichever thread runs the operation, report it on the Tk thread
+        instrumentation.profile_next(name, lambda path, summary: self.root.after(
+            0, self.show_profile_summary, path, summary))
+
+    def show_profile_summary(self, path, summary):
+        window = tk.Toplevel(self.root)
+        window.title("Profile Saved")
+        ttk.Label(window, text=f"cProfile output written to: {path}").pack(anchor=tk.W, padx=5, pady=5)
+        text = tk.Text(window, width=120, height=30, wrap=tk.NONE, font='TkFixedFont')
+        text.insert('1.0', summary)
+        text.config(state=tk.DISABLED)
+        text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+    def show_stats_panel(self):
+        window = tk.Toplevel(self.root)
+        window.title("Performance Stats")
+        columns = ("count", "total", "mean", "max")
+        tree = ttk.Treeview(window, columns=columns, height=20)
+        tree.heading("#0", text="Operation")
+        for column, heading in zip(columns, ("Count", "Total ms", "Mean ms", "Max ms")):
+            tree.heading(column, text=heading)
+            tree.column(column, width=90, anchor=tk.E)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            snapshot = instrumentation.snapshot()
+            for name, timer in snapshot['timers'].items():
+                tree.insert("", tk.END, text=name, values=(timer['count'], f"{timer['total_ms']:.1f}",
+                                                          f"{timer['mean_ms']:.2f}", f"{timer['max_ms']:.1f}"))
+            for name, value in snapshot['counters'].items():
+                tree.insert("", tk.END, text=name, values=(value, "", "", ""))
+            window.after(1000, refresh)
+
+        if not instrumentation.enabled:
+            ttk.Label(window, text="Instrumentation is off, enable it in the Debug menu.").pack(pady=5)
+        refresh()
+
+    def export_stats(self):
+        path = filedialog.asksaveasfilename(title="Export Stats", defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            if path.lower().endswith('.csv'):
+                instrumentation.dump_csv(path)
+            else:
+                instrumentation.dump_json(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Error writing stats: {e}")
+
+    def show_cache_stats(self):
+        lines = []
+        for name, cache in (("Thumbnails", self.thumbnail_cache), ("Tk images", self.photo_image_cache)):
+            stats = cache.stats()
+            lines.append(f"{name}: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB, "
+                         f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
+        messagebox.showinfo("Cache Statistics", "\n".join(lines))
+
+    def clear_photo_frame(self):
         for widget in self.photo_frame.winfo_children():
             widget.destroy()
+        self.loading_label = None
+        self.grid_canvas = None
+        self.grid_tiles = []
+
+    def change_view_mode(self):
+        self.current_page = 1
+        self.clear_photo_frame()
+        self.display_photos()
+
+    @instrumentation.timed('grid.display')
+    def display_photos(self):
+        if self.photo_data and self.view_mode.get() == 'scroll':
+            self.show_scroll_grid()
+            return
+
+        self.clear_photo_frame()
 
         if not self.photo_data:
             ttk.Label(self.photo_frame, text="No photos found in the archive.").pack(padx=20, pady=20)
@@ -216,7 +613,13 @@ class PhotoViewerApp:
         start_index = (self.current_page - 1) * self.photos_per_page
         end_index = start_index + self.photos_per_page
 
-        photos_to_display = self.get_filtered_photos()[start_index:end_index]
+        filtered_photos = self.get_filtered_photos()
+        photos_to_display = filtered_photos[start_index:end_index]
+        # previous and next pages are decoded after the visible one so page flips are instant
+        prefetch = (filtered_photos[end_index:end_index + self.photos_per_page] +
+                    filtered_photos[max(0, start_index - self.photos_per_page):start_index])
+        self.cancel_thumbnail_requests(keep=[item[0] for item in photos_to_display + prefetch])
+        self.pending_tiles = {}
 
         row_num = 0
         col_num = 0
@@ -224,16 +627,14 @@ class PhotoViewerApp:
         for item in photos_to_display:
             filepath = item[0]
             try:
-                photo_image = self.get_thumbnail(filepath)
-
                 label_frame = ttk.Frame(self.photo_frame)  # Frame for each image + label
                 label_frame.grid(row=row_num, column=col_num, padx=5, pady=5)
 
-                label = ttk.Label(label_frame, image=photo_image)
-                label.image = photo_image
+                label = ttk.Label(label_frame, image=self.placeholder_image, compound=tk.CENTER)
                 label.pack()
+                self.request_thumbnail(filepath, label)
 
-                filename = os.path.basename(filepath)
+                filename = self.photo_caption(filepath)
                 name_label = ttk.Label(label_frame, text=filename)
                 name_label.pack()
 
@@ -250,6 +651,87 @@ class PhotoViewerApp:
             except Exception as e:
                 print(f"Error displaying image {filepath}: {e}")
 
+        for item in prefetch:
+            self.request_thumbnail(item[0])
+        self.update_page_label()
+
+    def show_scroll_grid(self):
+        if self.grid_canvas is None:
+            self.clear_photo_frame()
+            self.grid_canvas = tk.Canvas(self.photo_frame, highlightthickness=0,
+                                         yscrollincrement=self.tile_height // 4)
+            scrollbar = ttk.Scrollbar(self.photo_frame, orient=tk.VERTICAL, command=self.scroll_grid)
+            self.grid_canvas.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            self.grid_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            self.grid_canvas.bind("<Configure>", lambda event: self.refresh_visible_tiles())
+            self.bind_grid_mousewheel(self.grid_canvas)
+        rows = (len(self.get_filtered_photos()) + self.grid_cols - 1) // self.grid_cols
+        self.grid_canvas.configure(scrollregion=(0, 0, self.grid_cols * self.tile_width, rows * self.tile_height))
+        self.refresh_visible_tiles()
+
+    def scroll_grid(self, *args):
+        self.grid_canvas.yview(*args)
+        self.refresh_visible_tiles()
+
+    def bind_grid_mousewheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_grid_mousewheel)  # Windows and macOS
+        widget.bind("<Button-4>", self.on_grid_mousewheel)  # Linux
+        widget.bind("<Button-5>", self.on_grid_mousewheel)
+
+    def on_grid_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            steps = -max(1, abs(event.delta) // 120)
+        else:
+            steps = max(1, abs(event.delta) // 120)
+        self.scroll_grid('scroll', steps, 'units')
+
+    @instrumentation.timed('grid.refresh')
+    def refresh_visible_tiles(self):
+        # Binds the tile pool to the rows currently in view; photo i always uses tile i % pool size,
+        # so scrolling by one row only rebinds one row of tiles
+        if self.grid_canvas is None:
+            return
+        photos = self.get_filtered_photos()
+        cols = self.grid_cols
+        visible_rows = self.grid_canvas.winfo_height() // self.tile_height + 2
+        pool_size = visible_rows * cols
+        while len(self.grid_tiles) < pool_size:
+            tile = GridTile(self.grid_canvas, self.tile_width, self.tile_height)
+            for widget in (tile.frame, tile.image_label, tile.name_label):
+                self.bind_grid_mousewheel(widget)
+            # Bind right-click to show context menu
+            tile.image_label.bind("<Button-3>", lambda event, t=tile: self.show_context_menu(event, t.filepath))
+            # Bind left-click to show full size image
+            tile.image_label.bind("<Button-1>", lambda event, t=tile: self.open_full_size_image(event, t.filepath))
+            self.grid_tiles.append(tile)
+
+        first_index = max(0, int(self.grid_canvas.canvasy(0) // self.tile_height)) * cols
+        shown = set()
+        for index in range(first_index, min(first_index + pool_size, len(photos))):
+            tile = self.grid_tiles[index % pool_size]
+            filepath = photos[index][0]
+            row, col = divmod(index, cols)
+            self.grid_canvas.coords(tile.window, col * self.tile_width, row * self.tile_height)
+            self.grid_canvas.itemconfigure(tile.window, state='normal')
+            if tile.filepath != filepath:
+                tile.filepath = filepath
+                tile.name_label.config(text=self.photo_caption(filepath))
+                tile.image_label.config(image=self.placeholder_image, text='')
+                self.request_thumbnail(filepath, tile.image_label)
+            shown.add(id(tile))
+        for tile in self.grid_tiles:
+            if id(tile) not in shown:
+                tile.filepath = None
+                self.grid_canvas.itemconfigure(tile.window, state='hidden')
+
+        # one screen above and below is decoded ahead of scrolling
+        prefetch = (photos[first_index + pool_size:first_index + 2 * pool_size] +
+                    photos[max(0, first_index - pool_size):first_index])
+        self.cancel_thumbnail_requests(keep=[item[0] for item in photos[first_index:first_index + pool_size] +
+                                             prefetch])
+        for item in prefetch:
+            self.request_thumbnail(item[0])
         self.update_page_label()
 
     def show_context_menu(self, event, filepath):
@@ -286,12 +768,9 @@ class PhotoViewerApp:
 
     def open_full_size_image(self, event, filepath):
         try:
-            img = Image.open(filepath)
-            self.current_full_size_image = img  # stores the current image to use when rotating and zooming.
             if self.full_size_window:
                 self.full_size_window.destroy()
             self.full_size_window = tk.Toplevel(self.root)
-            self.full_size_window.title(os.path.basename(filepath))
             # Zoom Control Frame
             zoom_control_frame = ttk.Frame(self.full_size_window)
             zoom_control_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -301,139 +780,361 @@ class PhotoViewerApp:
                                                                                                          padx=5)
 
             # Zoom Scale
-            self.zoom_percentage_var = tk.StringVar(value="100%")
+            self.zoom_percentage_var = tk.StringVar()
             zoom_percentage_label = ttk.Label(zoom_control_frame, textvariable=self.zoom_percentage_var, width=5)
             zoom_percentage_label.pack(side=tk.LEFT, padx=5)
 
             # Zoom In Button
             ttk.Button(zoom_control_frame, text="+", width=3, command=lambda: self.zoom_image(1.1)).pack(side=tk.LEFT,
                                                                                                          padx=5)
-            # Canvas Creation
-            self.canvas = tk.Canvas(self.full_size_window)
+            # Next / Previous photo in the grid order
+            ttk.Button(zoom_control_frame, text="Next", command=lambda: self.step_full_size_image(1)).pack(
+                side=tk.RIGHT, padx=5)
+            ttk.Button(zoom_control_frame, text="Previous", command=lambda: self.step_full_size_image(-1)).pack(
+                side=tk.RIGHT, padx=5)
+            self.full_size_window.bind("<Left>", lambda event: self.step_full_size_image(-1))
+            self.full_size_window.bind("<Right>", lambda event: self.step_full_size_image(1))
+
+            # Canvas Creation, sized for a screen-fitted image
+            self.window_width, self.window_height = self.viewer_fit_size
+            self.canvas = tk.Canvas(self.full_size_window, width=self.window_width, height=self.window_height)
             self.canvas.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-            self.full_size_image = ImageTk.PhotoImage(img)
-            self.canvas_image = self.canvas.create_image(0, 0, image=self.full_size_image, anchor=tk.NW)
-            # Calculate window size with 100px padding
-            self.window_width = self.full_size_image.width() + 100
-            self.window_height = self.full_size_image.height() + 100
-            self.full_size_window.geometry(f"{self.window_width}x{self.window_height}")
-
-            # Calculate Image Boundaries
-            self.image_width = self.full_size_image.width()
-            self.image_height = self.full_size_image.height()
+            self.canvas_image = self.canvas.create_image(0, 0, anchor=tk.NW)
+
             # Image Info
             info_frame = ttk.Frame(self.full_size_window)
             info_frame.pack(pady=5)
-
-            ttk.Label(info_frame, text=f"Filename: {os.path.basename(filepath)}").pack()
-            ttk.Label(info_frame, text=f"Dimensions: {img.width}x{img.height}").pack()
-            date_taken = self.extract_date(filepath)
-            if date_taken:
-                ttk.Label(info_frame, text=f"Date Taken: {date_taken.strftime('%Y-%m-%d')}").pack()
-            else:
-                file_date = self.get_file_modification_date(filepath)
-                ttk.Label(info_frame, text=f"Date Modified: {file_date.strftime('%Y-%m-%d')}").pack()
+            self.viewer_info_vars = [tk.StringVar() for _ in range(3)]
+            for info_var in self.viewer_info_vars:
+                ttk.Label(info_frame, textvariable=info_var).pack()
 
             # Bind image for rotate, panning
-            self.canvas.tag_bind(self.canvas_image, "<Button-1>",
-                                 lambda event: self.handle_image_click(event, filepath))
+            self.canvas.tag_bind(self.canvas_image, "<Shift-ButtonPress-1>",
+                                 lambda event: self.handle_image_click(event, self.viewer_filepath))
             self.canvas.tag_bind(self.canvas_image, "<ButtonPress-1>", self.start_pan)
             self.canvas.tag_bind(self.canvas_image, "<B1-Motion>", self.pan_image)
+            self.canvas.bind("<Configure>", self.on_viewer_resize)
+
+            self.show_full_size_image(filepath)
+            # Calculate window size with 100px padding around the fitted image
+            self.full_size_window.geometry(f"{self.image_width + 100}x{self.image_height + 100}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Error opening image: {e}")
+
+    def load_viewer_image(self, filepath):
+        # (pyramid, date_taken) with the screen-fitted level decoded; runs on the preload thread too
+        entry = self.viewer_cache.get(filepath)
+        if entry is None:
+            pyramid = ImagePyramid(filepath)
+            fit = min(1.0, self.viewer_fit_size[0] / pyramid.size[0], self.viewer_fit_size[1] / pyramid.size[1])
+            pyramid.get_level(pyramid.level_for(fit))
+            entry = (pyramid, read_photo_metadata(filepath)[0])
+            self.viewer_cache.put(filepath, entry)
+        return entry
+
+    def show_full_size_image(self, filepath):
+        future = self.preload_requests.get(filepath)
+        if future is not None and not future.cancel():
+            future.result()  # already being decoded in the background, wait for it instead of decoding twice
+        pyramid, date_taken = self.load_viewer_image(filepath)
+        self.current_pyramid = pyramid  # stores the current image to use when rotating and zooming.
+        self.viewer_filepath = filepath
+        self.full_size_window.title(os.path.basename(filepath))
+
+        # Start fitted to the canvas; only the visible region is ever rendered
+        width, height = pyramid.size
+        self.zoom_level = min(1.0, self.window_width / width, self.window_height / height)
+        self.zoom_percentage_var.set(f"{int(self.zoom_level * 100)}%")
+        self.image_width = int(width * self.zoom_level)
+        self.image_height = int(height * self.zoom_level)
+        self.image_x_offset = 0
+        self.image_y_offset = 0
+        self.clamp_offsets()
+        self.render_pending = False
+        self.render_view()
+
+        self.viewer_info_vars[0].set(f"Filename: {os.path.basename(filepath)}")
+        self.viewer_info_vars[1].set(f"Dimensions: {width}x{height}")
+        if date_taken:
+            self.viewer_info_vars[2].set(f"Date Taken: {date_taken.strftime('%Y-%m-%d')}")
+        else:
+            file_date = self.get_file_modification_date(filepath)
+            self.viewer_info_vars[2].set(f"Date Modified: {file_date.strftime('%Y-%m-%d')}")
+        self.preload_neighbours(filepath)
+
+    def viewer_position(self, photos, filepath):
+        # Index of filepath in photos, checking the last known position before searching
+        if self.viewer_index < len(photos) and photos[self.viewer_index][0] == filepath:
+            return self.viewer_index
+        for index, item in enumerate(photos):
+            if item[0] == filepath:
+                return index
+        return None
+
+    def step_full_size_image(self, step):
+        photos = self.get_filtered_photos()
+        index = self.viewer_position(photos, self.viewer_filepath)
+        if index is None or not 0 <= index + step < len(photos):
+            return
+        self.viewer_index = index + step
+        try:
+            self.show_full_size_image(photos[self.viewer_index][0])
         except Exception as e:
             messagebox.showerror("Error", f"Error opening image: {e}")
 
+    def preload_neighbours(self, filepath):
+        # Decodes the photos around the current one in the background so stepping is instant
+        photos = self.get_filtered_photos()
+        index = self.viewer_position(photos, filepath)
+        if index is None:
+            return
+        self.viewer_index = index
+        for future in self.preload_requests.values():
+            future.cancel()
+        neighbours = [index + 1, index - 1, index + 2]
+        self.preload_requests = {photos[i][0]: self.preload_pool.submit(self.preload_viewer_image, photos[i][0])
+                                 for i in neighbours if 0 <= i < len(photos)}
+
+    def preload_viewer_image(self, filepath):
+        try:
+            self.load_viewer_image(filepath)
+        except Exception as e:
+            print(f"Error preloading {filepath}: {e}")
+
     def handle_image_click(self, event, filepath):
-        if event.state & 0x0004:  # Shift key is pressed
-            self.rotate_image(90)
+        # bound to Shift+click only
+        self.rotate_image(90)
 
     def start_pan(self, event):
         self.pan_start_x = event.x
         self.pan_start_y = event.y
 
-    def pan_image(self, event):
-        if self.current_full_size_image:
-            dx = event.x - self.pan_start_x
-            dy = event.y - self.pan_start_y
-
-            # Calculate the new offsets
-            new_x_offset = self.image_x_offset + dx
-            new_y_offset = self.image_y_offset + dy
-
-            # Calculate the bounds of the image
-            img_width = int(self.current_full_size_image.width * self.zoom_level)
-            img_height = int(self.current_full_size_image.height * self.zoom_level)
-
-            max_x = 0
-            min_x = self.window_width - img_width
-            max_y = 0
-            min_y = self.window_height - img_height
-
-            # Apply bounds
-            if img_width > self.window_width:
-                new_x_offset = max(min(new_x_offset, max_x), min_x)
-            else:
-                new_x_offset = (self.window_width - img_width) / 2
-            if img_height > self.window_height:
-                new_y_offset = max(min(new_y_offset, max_y), min_y)
-            else:
-                new_y_offset = (self.window_height - img_height) / 2
+    def clamp_offsets(self):
+        # Keeps the image covering the canvas, or centred when it is smaller than the canvas
+        if self.image_width > self.window_width:
+            self.image_x_offset = max(min(self.image_x_offset, 0), self.window_width - self.image_width)
+        else:
+            self.image_x_offset = (self.window_width - self.image_width) / 2
+        if self.image_height > self.window_height:
+            self.image_y_offset = max(min(self.image_y_offset, 0), self.window_height - self.image_height)
+        else:
+            self.image_y_offset = (self.window_height - self.image_height) / 2
+
+    def schedule_render(self):
+        # Coalesces bursts of pan/resize events into one render
+        if not self.render_pending:
+            self.render_pending = True
+            self.full_size_window.after_idle(self.render_view)
+
+    @instrumentation.timed('viewer.render')
+    def render_view(self):
+        # Resamples just the part of the image visible in the canvas at the current zoom level
+        self.render_pending = False
+        if not self.current_pyramid or not self.canvas or not self.canvas.winfo_exists():
+            return
+        left = max(0, self.image_x_offset)
+        top = max(0, self.image_y_offset)
+        right = min(self.window_width, self.image_x_offset + self.image_width)
+        bottom = min(self.window_height, self.image_y_offset + self.image_height)
+        if right - left < 1 or bottom - top < 1:
+            return
+        box = ((left - self.image_x_offset) / self.zoom_level, (top - self.image_y_offset) / self.zoom_level,
+               (right - self.image_x_offset) / self.zoom_level, (bottom - self.image_y_offset) / self.zoom_level)
+        view = self.current_pyramid.render(self.zoom_level, box, (int(right - left), int(bottom - top)))
+        self.viewer_cache.resize(self.viewer_filepath)  # zooming in may have decoded a finer level
+        self.current_zoom_image = ImageTk.PhotoImage(view)
+        self.canvas.itemconfig(self.canvas_image, image=self.current_zoom_image)
+        self.canvas.coords(self.canvas_image, int(left), int(top))
+
+    def on_viewer_resize(self, event):
+        self.window_width = event.width
+        self.window_height = event.height
+        self.clamp_offsets()
+        self.schedule_render()
 
-            self.image_x_offset = new_x_offset
-            self.image_y_offset = new_y_offset
+    def pan_image(self, event):
+        if self.current_pyramid:
+            self.image_x_offset += event.x - self.pan_start_x
+            self.image_y_offset += event.y - self.pan_start_y
+            self.clamp_offsets()
 
             self.pan_start_x = event.x
             self.pan_start_y = event.y
 
-            self.canvas.move(self.canvas_image, dx, dy)
+            self.schedule_render()
 
+    @instrumentation.timed('viewer.rotate')
     def rotate_image(self, angle):
-        if self.current_full_size_image:
-            rotated_img = self.current_full_size_image.rotate(angle, expand=True)
-            self.current_full_size_image = rotated_img
-            self.current_zoom_image = ImageTk.PhotoImage(rotated_img)
-            self.canvas.itemconfig(self.canvas_image, image=self.current_zoom_image)
+        if self.current_pyramid:
+            transposes = {90: Image.Transpose.ROTATE_90, 180: Image.Transpose.ROTATE_180,
+                          270: Image.Transpose.ROTATE_270}
+            self.current_pyramid.transpose(transposes[angle % 360])
+            self.viewer_cache.pop(self.viewer_filepath)  # a later visit starts unrotated again
+            self.image_width = int(self.current_pyramid.size[0] * self.zoom_level)
+            self.image_height = int(self.current_pyramid.size[1] * self.zoom_level)
             self.image_x_offset = 0
             self.image_y_offset = 0
-            self.canvas.move(self.canvas_image, -self.canvas.coords(self.canvas_image)[0] + self.image_x_offset,
-                             -self.canvas.coords(self.canvas_image)[1] + self.image_y_offset)
-            self.image_width = self.current_zoom_image.width()
-            self.image_height = self.current_zoom_image.height()
-            window_width = self.image_width + 100
-            window_height = self.image_height + 100
-            self.full_size_window.geometry(f"{window_width}x{window_height}")
+            self.clamp_offsets()
+            self.render_view()
 
+    @instrumentation.timed('viewer.zoom')
     def zoom_image(self, zoom_factor):
-        if self.current_full_size_image:
+        if self.current_pyramid:
+            # keep the point under the canvas centre in place
+            center_x = self.window_width / 2
+            center_y = self.window_height / 2
+            self.image_x_offset = center_x - (center_x - self.image_x_offset) * zoom_factor
+            self.image_y_offset = center_y - (center_y - self.image_y_offset) * zoom_factor
             self.zoom_level *= zoom_factor
-            width = int(self.current_full_size_image.width * self.zoom_level)
-            height = int(self.current_full_size_image.height * self.zoom_level)
-            zoomed_img = self.current_full_size_image.resize((width, height))
-            self.current_zoom_image = ImageTk.PhotoImage(zoomed_img)
-            self.canvas.itemconfig(self.canvas_image, image=self.current_zoom_image)
-            self.image_x_offset = 0
-            self.image_y_offset = 0
-            self.canvas.move(self.canvas_image, -self.canvas.coords(self.canvas_image)[0] + self.image_x_offset,
-                             -self.canvas.coords(self.canvas_image)[1] + self.image_y_offset)
-            self.image_width = self.current_zoom_image.width()
-            self.image_height = self.current_zoom_image.height()
-            window_width = self.image_width + 100
-            window_height = self.image_height + 100
-            self.full_size_window.geometry(f"{window_width}x{window_height}")
+            self.image_width = int(self.current_pyramid.size[0] * self.zoom_level)
+            self.image_height = int(self.current_pyramid.size[1] * self.zoom_level)
+            self.clamp_offsets()
+            self.render_view()
             zoom_percentage = int(self.zoom_level * 100)
             self.zoom_percentage_var.set(f"{zoom_percentage}%")
 
+    def get_date_index(self):
+        if self.date_index is None or self.date_index[0] != self.photo_data_version:
+            self.date_index = (self.photo_data_version, DateIndex(self.photo_data))
+        return self.date_index[1]
+
     def get_filtered_photos(self):
-        if self.filtered_date:
-            return [item for item in self.photo_data if item[1] and item[1].date() == self.filtered_date]
-        else:
+        if self.duplicate_view:
+            return self.duplicate_view[0]
+        if not self.date_from and not self.date_to:
             return self.photo_data
+        key = (self.photo_data_version, self.date_from, self.date_to)
+        if self.filtered_view is None or self.filtered_view[:3] != key:
+            self.filtered_view = key + (self.get_date_index().range(self.date_from, self.date_to),)
+        return self.filtered_view[3]
+
+    def photo_caption(self, filepath):
+        if self.duplicate_view:
+            return f"Group {self.duplicate_view[1].get(filepath)}: {os.path.basename(filepath)}"
+        return os.path.basename(filepath)
+
+    def find_duplicates(self):
+        # Groups look-alike photos (copies, re-encodes, burst shots) by perceptual hash; Reset Filter
+        # goes back to all photos
+        if not self.photo_data or self.loading_in_progress:
+            messagebox.showinfo("Find Duplicates", "Wait until the photos are loaded.")
+            return
+        threshold = simpledialog.askinteger("Find Duplicates",
+                                            "Maximum differing hash bits (0 finds exact copies only):",
+                                            initialvalue=6, minvalue=0, maxvalue=10, parent=self.root)
+        if threshold is None:
+            return
+        threading.Thread(target=self.hash_and_group, args=(self.load_generation, list(self.photo_data), threshold),
+                         daemon=True).start()
+
+    def hash_photo(self, filepath):
+        try:
+            return perceptual_hashes(self.load_thumbnail_image(filepath, keep=False))
+        except Exception as e:
+            print(f"Error hashing {filepath}: {e}")
+            return None
+
+    @instrumentation.timed('duplicates.total')
+    def hash_and_group(self, generation, photos, threshold):
+        # Runs on a worker thread; hashes come from the metadata index where possible, the rest are
+        # computed from the thumbnails and stored back
+        index = self.get_metadata_index()
+        hashes = dict(self.photo_hashes)
+        if index:
+            hashes.update(index.get_hashes(os.path.abspath(self.archive_path)))  # indexed paths are absolute
+        missing = [filepath for filepath, _ in photos if filepath not in hashes]
+        pool = ThreadPoolExecutor(max_workers=self.scan_workers)
+        try:
+            computed = []
+            for count, (filepath, result) in enumerate(zip(missing, pool.map(self.hash_photo, missing)), 1):
+                if generation != self.load_generation:
+                    return
+                if result:
+                    hashes[filepath] = self.photo_hashes[filepath] = result
+                    computed.append((filepath,) + result)
+                if count % 200 == 0 or count == len(missing):
+                    if index:
+                        index.store_hashes(computed)
+                    computed = []
+                    self.root.after(0, self.page_label.config, {'text': f"Hashing photos: {count} / {len(missing)}"})
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        photos = [item for item in photos if item[0] in hashes]
+        with instrumentation.timer('duplicates.compare'):
+            groups = find_duplicate_groups([hashes[item[0]] for item in photos], threshold)
+        self.root.after(0, self.show_duplicates, generation, [[photos[i] for i in group] for group in groups])
+
+    def show_duplicates(self, generation, groups):
+        if generation != self.load_generation:
+            return
+        if not groups:
+            self.update_page_label()
+            messagebox.showinfo("Find Duplicates", "No duplicates found.")
+            return
+        self.duplicate_view = ([item for group in groups for item in group],
+                               {item[0]: number for number, group in enumerate(groups, 1) for item in group})
+        self.clear_photo_frame()
+        self.go_to_start()
+        self.display_photos()
+
+    def show_date_histogram(self):
+        window = tk.Toplevel(self.root)
+        window.title("Photos per Date")
+        by_var = tk.StringVar(value='month')
+        options_frame = ttk.Frame(window)
+        options_frame.pack(fill=tk.X, padx=5, pady=5)
+        tree = ttk.Treeview(window, columns=("count",), height=20)
+        tree.heading("#0", text="Date")
+        tree.heading("count", text="Photos")
+        tree.column("count", width=80, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        def fill():
+            tree.delete(*tree.get_children())
+            fmt = '%Y-%m' if by_var.get() == 'month' else '%Y-%m-%d'
+            for period, count in self.get_date_index().histogram(by_var.get()):
+                tree.insert("", tk.END, iid=period.isoformat(), text=period.strftime(fmt), values=(count,))
+
+        def open_period(event):
+            # double click filters the grid to that day or month
+            selection = tree.selection()
+            if not selection:
+                return
+            date_from = datetime.strptime(selection[0], '%Y-%m-%d').date()
+            if by_var.get() == 'month':
+                next_month = (date_from.replace(day=28) + timedelta(days=4)).replace(day=1)
+                date_to = next_month - timedelta(days=1)
+            else:
+                date_to = date_from
+            self.date_filter_var.set(date_from.isoformat())
+            self.date_to_var.set(date_to.isoformat())
+            self.set_date_range(date_from, date_to)
+
+        ttk.Radiobutton(options_frame, text="Per month", variable=by_var, value='month',
+                        command=fill).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(options_frame, text="Per day", variable=by_var, value='day',
+                        command=fill).pack(side=tk.LEFT, padx=5)
+        tree.bind("<Double-1>", open_period)
+        fill()
 
     def update_page_label(self):
         total_photos = len(self.get_filtered_photos())
+        loading = f" (loading, {len(self.photo_data)} found)" if self.loading_in_progress else ""
+        if self.grid_canvas is not None:
+            first = int(self.grid_canvas.canvasy(0) // self.tile_height) * self.grid_cols
+            last = min(total_photos, first + (self.grid_canvas.winfo_height() // self.tile_height + 1) * self.grid_cols)
+            self.page_label.config(text=f"Photos: {min(first + 1, total_photos)}-{last} / {total_photos}{loading}")
+            return
         total_pages = (total_photos + self.photos_per_page - 1) // self.photos_per_page
-        self.page_label.config(text=f"Page: {self.current_page} / {max(1, total_pages)}")
+        self.page_label.config(text=f"Page: {self.current_page} / {max(1, total_pages)}{loading}")
 
     def next_page(self):
+        if self.grid_canvas is not None:
+            self.scroll_grid('scroll', 1, 'pages')
+            return
         total_photos = len(self.get_filtered_photos())
         total_pages = (total_photos + self.photos_per_page - 1) // self.photos_per_page
         if self.current_page < total_pages:
@@ -441,6 +1142,9 @@ class PhotoViewerApp:
             self.display_photos()
 
     def prev_page(self):
+        if self.grid_canvas is not None:
+            self.scroll_grid('scroll', -1, 'pages')
+            return
         if self.current_page > 1:
             self.current_page -= 1
             self.display_photos()
@@ -0,0 +1,316 @@
+import os
+import random
+import struct
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+from PIL import Image
+
+import photo_core
+from benchmark import build_exif
+from photo_core import (IMAGE_EXTENSIONS, DateIndex, FolderWatcher, Instrumentation, LRUCache, MetadataIndex,
+                        SortedPhotoList, ThumbnailStore, find_duplicate_groups, iter_photo_batches, make_thumbnail,
+                        new_scan_stats, scan_photos)
+
+
+def write_jpeg(path, date_taken='2020:01:02 03:04:05', size=(64, 48)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size, (120, 80, 40)).save(path, exif=build_exif(date_taken))
+    return path
+
+
+def scanned(folder, index, recursive):
+    return sorted(path for path, _ in scan_photos(folder, IMAGE_EXTENSIONS, index, recursive=recursive))
+
+
+def test_recursive_scan_after_flat_scan_finds_subfolders(tmp_path):
+    root = str(tmp_path / 'archive')
+    top = write_jpeg(os.path.join(root, 'a.jpg'))
+    nested = write_jpeg(os.path.join(root, '2020', '01', 'b.jpg'))
+    index = MetadataIndex(str(tmp_path / 'index.sqlite'))
+    assert scanned(root, index, recursive=False) == [top]
+    assert scanned(root, index, recursive=True) == sorted([top, nested])
+    assert scanned(root, index, recursive=True) == sorted([top, nested])  # skipping unchanged folders
+    assert scanned(root, index, recursive=False) == [top]
+    index.close()
+
+
+def test_skipped_folder_picks_up_files_rewritten_in_place(tmp_path):
+    root = str(tmp_path / 'archive')
+    path = write_jpeg(os.path.join(root, 'a.jpg'), '2020:01:02 03:04:05')
+    index = MetadataIndex(str(tmp_path / 'index.sqlite'))
+    assert scan_photos(root, IMAGE_EXTENSIONS, index)[0][1].year == 2020
+    dir_mtime = os.stat(root).st_mtime_ns
+    write_jpeg(path, '2021:01:02 03:04:05', size=(80, 60))  # same name: the folder listing doesn't change
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    os.utime(root, ns=(dir_mtime, dir_mtime))
+    assert scan_photos(root, IMAGE_EXTENSIONS, index)[0][1].year == 2021
+    index.close()
+
+
+def test_full_rescan_reads_every_file_again(tmp_path):
+    root = str(tmp_path / 'archive')
+    for name in ('a.jpg', 'b.jpg', os.path.join('sub', 'c.jpg')):
+        write_jpeg(os.path.join(root, name))
+    index = MetadataIndex(str(tmp_path / 'index.sqlite'))
+    scan_photos(root, IMAGE_EXTENSIONS, index, recursive=True)
+    stats = new_scan_stats()
+    list(iter_photo_batches(root, IMAGE_EXTENSIONS, index, recursive=True, stats=stats))
+    assert (stats['parsed'], stats['dirs_skipped']) == (0, 2)
+    stats = new_scan_stats()
+    list(iter_photo_batches(root, IMAGE_EXTENSIONS, index, recursive=True, full_rescan=True, stats=stats))
+    assert (stats['photos'], stats['parsed'], stats['dirs_skipped']) == (3, 3, 0)
+    index.close()
+
+
+def exif_bytes(date_taken, endian='<', in_ifd0=None):
+    exif = Image.Exif()
+    exif.endian = endian
+    exif.get_ifd(0x8769)[0x9003] = date_taken
+    if in_ifd0:
+        exif[0x9003] = in_ifd0
+    return exif.tobytes()
+
+
+def save_photo(path, kind, exif=None, size=(70, 50)):
+    img = Image.new('I;16B' if kind == 'tiff_mm' else 'RGB', size)
+    options = {'exif': exif} if exif else {}
+    if kind == 'progressive':
+        options['progressive'] = True
+    elif kind == 'webp_lossless':
+        options['lossless'] = True
+    img.save(path, **options)
+    return path
+
+
+@pytest.mark.parametrize('kind, extension, endian, with_exif, signature', [
+    ('baseline', '.jpg', '<', True, b'\xff\xd8'),
+    ('progressive', '.jpg', '>', True, b'\xff\xd8'),
+    ('tiff', '.tif', '<', True, b'II*\x00'),
+    ('tiff_mm', '.tif', '>', True, b'MM\x00*'),
+    ('webp', '.webp', '<', False, b'VP8 '),
+    ('webp_lossless', '.webp', '<', False, b'VP8L'),
+    ('webp', '.webp', '>', True, b'VP8X'),
+])
+def test_header_parser_matches_pil(tmp_path, kind, extension, endian, with_exif, signature):
+    exif = exif_bytes('2019:05:06 07:08:09', endian) if with_exif else None
+    path = save_photo(str(tmp_path / f'photo{extension}'), kind, exif)
+    with open(path, 'rb') as f:
+        assert signature in f.read(16)
+    date_taken = datetime(2019, 5, 6) if with_exif else None
+    assert photo_core.read_header_metadata(path) == photo_core.read_photo_metadata_pil(path) == (date_taken, 70, 50)
+
+
+def test_header_parser_prefers_the_exif_sub_ifd_like_pil(tmp_path):
+    exif = exif_bytes('2019:05:06 07:08:09', in_ifd0='2018:01:02 00:00:00')
+    path = save_photo(str(tmp_path / 'photo.tif'), 'tiff', exif)
+    assert photo_core.read_header_metadata(path) == photo_core.read_photo_metadata_pil(path)
+    assert photo_core.read_header_metadata(path)[0] == datetime(2019, 5, 6)
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_header_parser_ignores_placeholder_dates(tmp_path, endian):
+    path = save_photo(str(tmp_path / 'photo.jpg'), 'baseline', exif_bytes('0000:00:00 00:00:00', endian))
+    assert photo_core.read_header_metadata(path) == (None, 70, 50)
+    assert photo_core.read_photo_metadata(path) == (None, 70, 50)
+
+
+def test_jpeg_without_frame_header_falls_back_to_pil(tmp_path, monkeypatch):
+    path = str(tmp_path / 'photo.jpg')
+    exif = b'Exif\x00\x00' + exif_bytes('2019:05:06 07:08:09')[6:]
+    with open(path, 'wb') as f:  # SOI, APP1 and EOI, no SOFn
+        f.write(b'\xff\xd8\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif + b'\xff\xd9')
+    assert photo_core.read_header_metadata(path) == (datetime(2019, 5, 6), None, None)
+    fallbacks = []
+    monkeypatch.setattr(photo_core, 'read_photo_metadata_pil', lambda filepath: fallbacks.append(filepath) or 'pil')
+    assert photo_core.read_photo_metadata(path) == 'pil' and fallbacks == [path]
+
+
+@pytest.mark.parametrize('damage', ['truncated_exif', 'corrupt_exif', 'corrupt_marker', 'truncated_file'])
+def test_damaged_header_falls_back_to_pil(tmp_path, monkeypatch, damage):
+    path = save_photo(str(tmp_path / 'photo.jpg'), 'baseline', exif_bytes('2019:05:06 07:08:09'))
+    with open(path, 'rb') as f:
+        data = f.read()
+    app1 = data.index(b'\xff\xe1')
+    length = struct.unpack('>H', data[app1 + 2:app1 + 4])[0]
+    if damage == 'truncated_exif':  # the IFD0 offset points past the end of the segment
+        data = data[:app1 + 14] + struct.pack('<I', 0xFFFF) + data[app1 + 18:]
+    elif damage == 'corrupt_exif':
+        data = data[:app1 + 10] + b'XX*\x00' + data[app1 + 14:]
+    elif damage == 'corrupt_marker':
+        data = data[:app1 + 2 + length] + b'\x00' + data[app1 + 3 + length:]
+    else:
+        data = data[:app1 + 2 + length // 2]
+    with open(path, 'wb') as f:
+        f.write(data)
+    with pytest.raises(Exception):
+        photo_core.read_header_metadata(path)
+    fallbacks = []
+    monkeypatch.setattr(photo_core, 'read_photo_metadata_pil', lambda filepath: fallbacks.append(filepath) or 'pil')
+    assert photo_core.read_photo_metadata(path) == 'pil' and fallbacks == [path]
+
+
+def test_thumbnail_store_prune_keeps_recently_used(tmp_path):
+    store = ThumbnailStore(str(tmp_path / 'thumbs'), max_bytes=0)
+    paths = [write_jpeg(str(tmp_path / 'photos' / f'{i}.jpg')) for i in range(3)]
+    for i, path in enumerate(paths):
+        store.put(path, Image.new('RGB', (20, 20), (i * 80, 0, 0)))
+    entry_sizes = [os.path.getsize(store.entry_path(store.key(path, os.stat(path)), '.jpg')) for path in paths]
+    for i, path in enumerate(paths):  # oldest use first
+        entry = store.entry_path(store.key(path, os.stat(path)), '.jpg')
+        os.utime(entry, (1000 + i, 1000 + i))
+    assert store.get(paths[0]) is not None  # touched, now the most recent
+    removed, _ = store.prune(max_bytes=entry_sizes[0] + entry_sizes[2] // 2)
+    assert removed == 2
+    assert store.has(paths[0]) and not store.has(paths[1]) and not store.has(paths[2])
+
+
+def test_draft_thumbnail_is_loaded_and_savable(tmp_path):
+    # 1600x1200 drafts straight to 200x150, so thumbnail() itself has nothing left to resize
+    path = str(tmp_path / 'large.jpg')
+    Image.new('RGB', (1600, 1200), (10, 200, 30)).save(path, quality=90)
+    for strategy in ('draft', 'auto'):
+        img = make_thumbnail(path, (200, 200), strategy)
+        assert img.size == (200, 150)
+        img.save(str(tmp_path / f'thumb_{strategy}.jpg'))
+
+
+def test_lru_cache_resize_counts_growth_and_evicts_older_entries():
+    cache = LRUCache(max_bytes=100, sizeof=len)
+    cache.put('a', [0] * 30)
+    cache.put('b', [0] * 30)
+    grown = [0] * 30
+    cache.put('c', grown)
+    grown.extend([0] * 30)  # e.g. a pyramid decoding a finer level
+    cache.resize('c')
+    assert cache.stats()['bytes'] == 90
+    assert 'a' not in cache and 'b' in cache and 'c' in cache
+
+
+def test_instrumentation_profile_goes_to_callback_not_stdout(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('PHOTO_VIEWER_CACHE_DIR', str(tmp_path))
+    profiler = Instrumentation()
+    assert profiler.timer('idle') is profiler.timer('other')  # disabled: shared no-op
+    reports = []
+    profiler.profile_next('work', lambda path, summary: reports.append((path, summary)))
+    with profiler.timer('work'):
+        sum(range(1000))
+    path, summary = reports[0]
+    assert os.path.exists(path) and os.path.exists(os.path.splitext(path)[0] + '.txt')
+    assert 'function calls' in summary
+    assert capsys.readouterr().out == ''
+
+
+def photos_on(days):
+    # [(filepath, datetime)] named after their position, several photos may share a day
+    return [(f'{i}.jpg', datetime(2020, 1, 1) + timedelta(days=day)) for i, day in enumerate(days)]
+
+
+@pytest.mark.parametrize('batch_days', [[5], [5, 0, 20, 5, 9, 1]])  # bisect inserts, then a Timsort merge
+def test_sorted_photo_list_add_batch_is_stable(batch_days):
+    photos = SortedPhotoList(photos_on([0, 3, 5, 5, 10, 12, 20, 30]))
+    batch = [(f'new{i}.jpg', date) for i, (_, date) in enumerate(photos_on(batch_days))]
+    expected = sorted(list(photos) + batch, key=lambda item: item[1])  # sorted() is stable too
+    first = photos.add_batch(batch)
+    assert photos == expected and photos.keys == [date for _, date in expected]
+    assert first == min(expected.index(item) for item in batch)
+    assert photos.add_batch([]) == len(photos)
+    assert photos.remove_paths(['new0.jpg', '3.jpg', 'missing.jpg']) == 2
+    assert photos.keys == [date for _, date in photos] and '3.jpg' not in {path for path, _ in photos}
+
+
+@pytest.mark.parametrize('sort', [False, True])
+def test_date_index_range_and_histogram(sort):
+    days = [40, 0, 31, 3, 0, 45, 31]  # two photos each on Jan 1st and Feb 1st
+    photos = SortedPhotoList(photos_on(days)) if sort else photos_on(days)
+    index = DateIndex(photos)
+    jan = [item for item in photos if item[1].month == 1]
+    feb = [item for item in photos if item[1].month == 2]
+    assert index.range() == list(photos)
+    assert index.range(date(2020, 1, 1), date(2020, 1, 31)) == jan
+    assert index.range(date(2020, 2, 1)) == feb
+    assert index.range(date_to=date(2020, 1, 4)) == [item for item in jan if item[1].day <= 4]
+    assert index.range(date(2020, 2, 2), date(2020, 2, 9)) == [item for item in feb if item[1].day == 9]
+    assert index.range(date(2021, 1, 1)) == []
+    assert index.histogram() == [(date(2020, 1, 1), 2), (date(2020, 1, 4), 1), (date(2020, 2, 1), 2),
+                                 (date(2020, 2, 10), 1), (date(2020, 2, 15), 1)]
+    assert index.histogram(by='month') == [(date(2020, 1, 1), 3), (date(2020, 2, 1), 4)]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.mark.parametrize('recursive', [True, False])
+@pytest.mark.parametrize('notify', [False, True])
+def test_folder_watcher_reports_only_real_changes(tmp_path, monkeypatch, notify, recursive):
+    if notify and photo_core.Observer is None:
+        pytest.skip("watchdog is not installed")
+    if not notify:
+        monkeypatch.setattr(photo_core, 'Observer', None)
+    root = str(tmp_path / 'archive')
+    first = write_jpeg(os.path.join(root, 'a.jpg'))
+    write_jpeg(os.path.join(root, '2020', 'b.jpg'))
+    index = MetadataIndex(str(tmp_path / 'index.sqlite'))
+    scan_photos(root, IMAGE_EXTENSIONS, index, recursive=recursive)
+    changes = []
+    # relative and with a trailing separator: the known photos must still match the indexed ones
+    monkeypatch.chdir(tmp_path)
+    watcher = FolderWatcher('archive' + os.sep, IMAGE_EXTENSIONS, lambda *delta: changes.append(delta), index,
+                            recursive=recursive, poll_interval=0.1, full_poll_interval=0.1, settle_delay=0.1)
+
+    def reported():
+        return ({path for delta in changes for path, _ in delta[0]}, {path for delta in changes for path in delta[1]})
+
+    watcher.start()
+    try:
+        time.sleep(0.5)
+        assert changes == []
+        top = write_jpeg(os.path.join(root, 'd.jpg'))
+        nested = write_jpeg(os.path.join(root, '2020', 'c.jpg'))
+        moved = write_jpeg(str(tmp_path / 'incoming' / 'inner.jpg'))
+        os.rename(str(tmp_path / 'incoming'), os.path.join(root, 'sub'))
+        moved = os.path.join(root, 'sub', os.path.basename(moved))
+        os.remove(first)
+        # a flat load never shows subfolder photos, so neither does its watcher
+        expected = ({top, nested, moved} if recursive else {top}, {first})
+        assert wait_for(lambda: reported() == expected)
+        time.sleep(0.5)
+        assert reported() == expected
+    finally:
+        watcher.stop()
+        index.close()
+
+
+def flip_bits(value, rng, count):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_find_duplicate_groups_stress(monkeypatch, vectorized):
+    # thousands of identical hashes (black frames, exact copies) next to a cluster of near copies
+    if vectorized and photo_core.np is None:
+        pytest.skip("numpy is not installed")
+    if not vectorized:
+        monkeypatch.setattr(photo_core, 'np', None)
+    rng = random.Random(0)
+    black = (0, 0)
+    base = (rng.getrandbits(64), rng.getrandbits(64))
+    near = [(flip_bits(base[0], rng, rng.randint(0, 2)), flip_bits(base[1], rng, rng.randint(0, 2)))
+            for _ in range(300)]
+    unrelated = [(rng.getrandbits(64), rng.getrandbits(64)) for _ in range(2000)]
+    hashes = [black] * 3000 + near + unrelated
+    start = time.perf_counter()
+    groups = find_duplicate_groups(hashes, threshold=6)
+    assert time.perf_counter() - start < 30
+    assert groups[0] == list(range(3000))
+    assert groups[1] == list(range(3000, 3300))
+    for group in groups[2:]:  # chance matches among random hashes, if any, stay small
+        assert all(position >= 3300 for position in group)